@@ -0,0 +1,280 @@
+import struct
+import zlib
+import numpy as np
+
+
+# The number of levels each of the hare and puma densities is reduced to in
+# GIF animations, so that every combination, and water, fits in the palette
+# of 256 colours.
+GIF_LEVELS = 15
+
+# The palette index of water squares in GIF animations.
+GIF_WATER = GIF_LEVELS * GIF_LEVELS
+
+def create_frame(land, hare_columns, puma_columns):
+    """
+    Creates an RGB frame with the same colours as the map files: the hare
+    and puma columns values and 0 for land squares, and 0, 0 and 255 for
+    water squares.
+
+    :param land: land
+    :type land: ndarray
+    :param hare_columns: hare_columns
+    :type hare_columns: ndarray
+    :param puma_columns: puma_columns
+    :type puma_columns: ndarray
+    :return: frame of shape (height, width, 3)
+    :rtype: ndarray
+    """
+    return np.stack((np.where(land, hare_columns, 0),
+                    np.where(land, puma_columns, 0),
+                    np.where(land, 0, 255)), axis=-1).astype(np.uint8)
+
+def find_changed_rectangle(previous_frame, frame):
+    """
+    Finds the smallest rectangle holding every pixel which differs between
+    two frames, so that only that rectangle needs to be stored.
+
+    :param previous_frame: previous_frame, or None for the first frame
+    :type previous_frame: ndarray
+    :param frame: frame
+    :type frame: ndarray
+    :return: top, left, bottom and right of the rectangle
+    :rtype: tuple
+    """
+    height, width = frame.shape[:2]
+    if previous_frame is None:
+        return 0, 0, height, width
+
+    changed = previous_frame != frame
+    if changed.ndim == 3:
+        changed = changed.any(axis=2)
+    rows = np.flatnonzero(changed.any(axis=1))
+    columns = np.flatnonzero(changed.any(axis=0))
+    if rows.size == 0:
+        # A frame must hold at least one pixel, even if nothing changed.
+        return 0, 0, 1, 1
+
+    return rows[0], columns[0], rows[-1] + 1, columns[-1] + 1
+
+class ApngAnimationWriter:
+    """
+    Writes frames to an animated PNG file as they are produced. Each frame
+    after the first only stores the rectangle which changed since the
+    previous frame, compressed with zlib.
+    """
+
+    def __init__(self, file_name, width, height, delay):
+        self.file_object = open(file_name, "wb")
+        self.width = width
+        self.height = height
+        self.delay = delay
+        self.number_of_frames = 0
+        self.sequence_number = 0
+        self.previous_frame = None
+
+        self.file_object.write(b"\x89PNG\r\n\x1a\n")
+        # 8 bits per channel, RGB, no interlacing.
+        self.write_chunk(b"IHDR", struct.pack(">IIBBBBB", width, height, 8,
+                                            2, 0, 0, 0))
+        # The number of frames is only known once the animation is closed,
+        # so this chunk is written again then.
+        self.animation_control_position = self.file_object.tell()
+        self.write_chunk(b"acTL", struct.pack(">II", 1, 0))
+
+    def write_chunk(self, chunk_type, data):
+        self.file_object.write(struct.pack(">I", len(data)) + chunk_type
+                            + data
+                            + struct.pack(">I", zlib.crc32(chunk_type + data)))
+
+    def add_frame(self, frame):
+        """
+        Adds a frame to the animation.
+
+        :param frame: frame of shape (height, width, 3)
+        :type frame: ndarray
+        """
+        top, left, bottom, right = find_changed_rectangle(
+            self.previous_frame, frame)
+        rectangle = frame[top:bottom, left:right]
+
+        # Frame delay in milliseconds, no disposal and no blending.
+        self.write_chunk(b"fcTL", struct.pack(">IIIIIHHBB",
+            self.sequence_number, right - left, bottom - top, left, top,
+            self.delay, 1000, 0, 0))
+        self.sequence_number += 1
+
+        # Each row of the image starts with the number of its filter, 0.
+        rows = np.zeros((bottom - top, 1 + 3 * (right - left)), np.uint8)
+        rows[:, 1:] = rectangle.reshape(bottom - top, -1)
+        data = zlib.compress(rows.tobytes(), 6)
+        if self.number_of_frames == 0:
+            self.write_chunk(b"IDAT", data)
+        else:
+            self.write_chunk(b"fdAT", struct.pack(">I", self.sequence_number)
+                            + data)
+            self.sequence_number += 1
+
+        self.number_of_frames += 1
+        self.previous_frame = frame
+
+    def close(self):
+        """
+        Finishes the animation, recording the number of frames, and closes
+        the file.
+        """
+        self.write_chunk(b"IEND", b"")
+        self.file_object.seek(self.animation_control_position)
+        self.write_chunk(b"acTL", struct.pack(">II",
+                                            max(1, self.number_of_frames), 0))
+        self.file_object.close()
+
+class GifAnimationWriter:
+    """
+    Writes frames to an animated GIF file as they are produced. The hare and
+    puma densities are each reduced to GIF_LEVELS levels so that the frames
+    fit a fixed palette, and each frame after the first only stores the
+    rectangle which changed since the previous frame.
+    """
+
+    def __init__(self, file_name, width, height, delay):
+        self.file_object = open(file_name, "wb")
+        # GIF delays are in hundredths of a second.
+        self.delay = max(1, round(delay / 10))
+        self.previous_frame = None
+
+        levels = np.arange(GIF_LEVELS) * 255 // (GIF_LEVELS - 1)
+        palette = np.zeros((256, 3), np.uint8)
+        palette[:GIF_WATER, 0] = np.repeat(levels, GIF_LEVELS)
+        palette[:GIF_WATER, 1] = np.tile(levels, GIF_LEVELS)
+        palette[GIF_WATER] = (0, 0, 255)
+
+        # Header, screen size with a global palette of 256 colours, the
+        # palette, and an extension which makes the animation loop forever.
+        self.file_object.write(b"GIF89a"
+            + struct.pack("<HHBBB", width, height, 0xF7, 0, 0)
+            + palette.tobytes()
+            + b"\x21\xFF\x0BNETSCAPE2.0\x03\x01\x00\x00\x00")
+
+    def add_frame(self, frame):
+        """
+        Adds a frame to the animation.
+
+        :param frame: frame of shape (height, width, 3)
+        :type frame: ndarray
+        """
+        # Reduce each land square to the palette index of its hare and puma
+        # levels, rounding to the nearest level.
+        indices = ((frame[..., 0].astype(int) * (GIF_LEVELS - 1) + 127)
+                    // 255 * GIF_LEVELS
+                + (frame[..., 1].astype(int) * (GIF_LEVELS - 1) + 127)
+                    // 255).astype(np.uint8)
+        indices[frame[..., 2] == 255] = GIF_WATER
+
+        top, left, bottom, right = find_changed_rectangle(
+            self.previous_frame, indices)
+
+        # Graphic control extension keeping the previous frame underneath,
+        # then the position and size of the rectangle and its pixels.
+        self.file_object.write(b"\x21\xF9\x04\x04"
+            + struct.pack("<H", self.delay) + b"\x00\x00"
+            + b"\x2C" + struct.pack("<HHHHB", left, top, right - left,
+                                    bottom - top, 0)
+            + b"\x08")
+        data = encode_lzw(indices[top:bottom, left:right].tobytes(), 8)
+        for start in range(0, len(data), 255):
+            block = data[start:start + 255]
+            self.file_object.write(bytes([len(block)]) + block)
+        self.file_object.write(b"\x00")
+
+        self.previous_frame = indices
+
+    def close(self):
+        """
+        Finishes the animation and closes the file.
+        """
+        self.file_object.write(b"\x3B")
+        self.file_object.close()
+
+def encode_lzw(data, minimum_code_size):
+    """
+    Compresses data with the variable-length LZW coding used by GIF files.
+
+    :param data: data
+    :type data: bytes
+    :param minimum_code_size: minimum_code_size
+    :type minimum_code_size: int
+    :return: compressed data
+    :rtype: bytearray
+    """
+    clear_code = 1 << minimum_code_size
+    end_code = clear_code + 1
+    output = bytearray()
+    bit_buffer = 0
+    number_of_bits = 0
+
+    # Codes are packed least significant bit first.
+    def emit(code, code_size):
+        nonlocal bit_buffer, number_of_bits
+        bit_buffer |= code << number_of_bits
+        number_of_bits += code_size
+        while number_of_bits >= 8:
+            output.append(bit_buffer & 0xFF)
+            bit_buffer >>= 8
+            number_of_bits -= 8
+
+    # Strings are looked up by the code of their prefix and their last byte.
+    table = {}
+    code_size = minimum_code_size + 1
+    next_code = end_code + 1
+    emit(clear_code, code_size)
+    prefix = data[0]
+    for byte in data[1:]:
+        key = (prefix << 8) | byte
+        code = table.get(key)
+        if code is not None:
+            prefix = code
+            continue
+        emit(prefix, code_size)
+        if next_code < 4096:
+            table[key] = next_code
+            next_code += 1
+            if next_code > (1 << code_size) and code_size < 12:
+                code_size += 1
+        else:
+            # Start again with an empty table once it is full.
+            emit(clear_code, code_size)
+            table = {}
+            code_size = minimum_code_size + 1
+            next_code = end_code + 1
+        prefix = byte
+    emit(prefix, code_size)
+    emit(end_code, code_size)
+    if number_of_bits:
+        output.append(bit_buffer & 0xFF)
+
+    return output
+
+def create_animation_writer(simulation_args, grid_dimensions):
+    """
+    Creates the writer for the animation file given by the simulation
+    arguments, choosing the format from its extension.
+
+    :param simulation_args: simulation_args
+    :type simulation_args: dict
+    :param grid_dimensions: grid_dimensions
+    :type grid_dimensions: list of type int
+    :return: animation writer, or None if no animation was asked for
+    :rtype: ApngAnimationWriter or GifAnimationWriter
+    """
+    file_name = simulation_args['animation_file']
+    if file_name is None:
+        return None
+
+    width, height = grid_dimensions[0], grid_dimensions[1]
+    if file_name.lower().endswith(".gif"):
+        return GifAnimationWriter(file_name, width, height,
+                                simulation_args['animation_delay'])
+    else:
+        return ApngAnimationWriter(file_name, width, height,
+                                simulation_args['animation_delay'])
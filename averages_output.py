@@ -0,0 +1,271 @@
+import json
+import os
+import numpy as np
+
+
+# The columns of the averages output, with the numpy type each is stored as
+# in the binary format.
+AVERAGES_COLUMNS = (
+    ("Timestep", "<i8"),
+    ("Time", "<f8"),
+    ("Hares", "<f8"),
+    ("Pumas", "<f8"),
+)
+
+def create_averages_columns(species_names):
+    """
+    Creates the columns of the averages output for the given species, one
+    column of averages for each species.
+
+    :param species_names: species_names
+    :type species_names: list of type str
+    :return: columns and the numpy type of each
+    :rtype: tuple
+    """
+    return AVERAGES_COLUMNS[:2] + tuple((name, "<f8")
+                                        for name in species_names)
+
+# The file in the directory of the binary format which lists its columns.
+MANIFEST_FILE_NAME = "manifest.json"
+
+# The number of bytes taken by the magic string, version and header of each
+# .npy file written by BinaryAveragesWriter. The header is padded to this
+# fixed size so it can be rewritten with the final number of rows in place.
+NPY_HEADER_SIZE = 128
+
+class CsvAveragesWriter:
+    """
+    Writes the averages to the averages.csv file, holding the rows in memory
+    and writing them to the file a block at a time rather than reopening the
+    file for every row.
+    """
+
+    def __init__(self, buffer_rows, file_name="averages.csv",
+                columns=AVERAGES_COLUMNS):
+        self.buffer_rows = max(1, buffer_rows)
+        self.rows = []
+        self.file_object = open(file_name, "w")
+        # Write a file header to the averages.csv file, representing the
+        # data which will be written to it.
+        self.file_object.write(",".join(name for name, _ in columns) + "\n")
+
+    def append(self, i, simulation_args, *averages):
+        """
+        Adds the average number of hares and pumas, or of each species, and
+        the corresponding timestep and time in seconds to the averages.
+
+        :param i: i
+        :type i: int
+        :param simulation_args: simulation_args
+        :type simulation_args: dict
+        :param averages: the average of each species
+        :type averages: float
+        """
+        self.rows.append(",".join("{}".format(value) for value in
+                        (i, i*simulation_args['time_step_size']) + averages)
+                        + "\n")
+        if len(self.rows) >= self.buffer_rows:
+            self.flush()
+
+    def flush(self):
+        """
+        Writes the rows held in memory to the file.
+        """
+        self.file_object.write("".join(self.rows))
+        self.file_object.flush()
+        self.rows = []
+
+    def record_stop(self, stopped_at, reason, timesteps_saved):
+        """
+        Writes why the simulation stopped early after the rows so far, as a
+        comment which load_averages skips.
+
+        :param stopped_at: the time step the simulation stopped at
+        :type stopped_at: int
+        :param reason: reason
+        :type reason: str
+        :param timesteps_saved: timesteps_saved
+        :type timesteps_saved: int
+        """
+        self.flush()
+        self.file_object.write("# Stopped early. Timestep: {} Reason: {} "
+                            "Timesteps saved: {}\n".format(stopped_at, reason,
+                                                        timesteps_saved))
+
+    def close(self):
+        """
+        Writes the rows held in memory to the file and closes it.
+        """
+        self.flush()
+        self.file_object.close()
+
+class BinaryAveragesWriter:
+    """
+    Writes the averages in a columnar binary format: a directory, averages/
+    by default, holding one .npy file per column. The rows are held in
+    memory and appended to the files a block at a time, and the header of
+    each file is updated with the number of rows after every block, so the
+    files can be loaded, or memory-mapped with load_averages, at any time.
+    The names and types of the columns are listed in a manifest file, so
+    the directory can be loaded whatever species were simulated.
+    """
+
+    def __init__(self, buffer_rows, directory_name="averages",
+                columns=AVERAGES_COLUMNS):
+        self.buffer_rows = max(1, buffer_rows)
+        self.rows = []
+        self.number_of_rows = 0
+        self.columns = columns
+        self.directory_name = directory_name
+        os.makedirs(directory_name, exist_ok=True)
+        self.manifest = {'columns' : [{'name' : name, 'dtype' : dtype}
+                                    for name, dtype in columns]}
+        self.write_manifest()
+        self.file_objects = []
+        for name, dtype in columns:
+            file_object = open(os.path.join(directory_name,
+                                            name.lower() + ".npy"), "wb")
+            write_npy_header(file_object, dtype, 0)
+            self.file_objects.append(file_object)
+
+    def append(self, i, simulation_args, *averages):
+        """
+        Adds the average number of hares and pumas, or of each species, and
+        the corresponding timestep and time in seconds to the averages.
+
+        :param i: i
+        :type i: int
+        :param simulation_args: simulation_args
+        :type simulation_args: dict
+        :param averages: the average of each species
+        :type averages: float
+        """
+        self.rows.append((i, i*simulation_args['time_step_size'])
+                        + averages)
+        if len(self.rows) >= self.buffer_rows:
+            self.flush()
+
+    def flush(self):
+        """
+        Appends the rows held in memory to the column files and updates the
+        number of rows in their headers.
+        """
+        if not self.rows:
+            return
+        self.number_of_rows += len(self.rows)
+        for column, ((_, dtype), file_object) in enumerate(
+                zip(self.columns, self.file_objects)):
+            file_object.write(np.array([row[column] for row in self.rows],
+                                    dtype).tobytes())
+            # Rewrite the header with the new number of rows and return to
+            # the end of the file for the next block.
+            file_object.seek(0)
+            write_npy_header(file_object, dtype, self.number_of_rows)
+            file_object.seek(0, os.SEEK_END)
+            file_object.flush()
+        self.rows = []
+
+    def close(self):
+        """
+        Writes the rows held in memory to the column files and closes them.
+        """
+        self.flush()
+        for file_object in self.file_objects:
+            file_object.close()
+
+    def record_stop(self, stopped_at, reason, timesteps_saved):
+        """
+        Adds why the simulation stopped early to the manifest.
+
+        :param stopped_at: the time step the simulation stopped at
+        :type stopped_at: int
+        :param reason: reason
+        :type reason: str
+        :param timesteps_saved: timesteps_saved
+        :type timesteps_saved: int
+        """
+        self.manifest['stopped_early'] = {
+            'timestep' : stopped_at,
+            'reason' : reason,
+            'timesteps_saved' : timesteps_saved,
+        }
+        self.write_manifest()
+
+    def write_manifest(self):
+        """
+        Writes the manifest file listing the columns.
+        """
+        with open(os.path.join(self.directory_name, MANIFEST_FILE_NAME),
+                "w") as file_object:
+            json.dump(self.manifest, file_object, indent=2)
+
+def write_npy_header(file_object, dtype, number_of_rows):
+    """
+    Writes the header of a one-dimensional .npy file, padded to
+    NPY_HEADER_SIZE bytes.
+
+    :param file_object: file_object
+    :type file_object: file
+    :param dtype: the numpy type of the column
+    :type dtype: str
+    :param number_of_rows: number_of_rows
+    :type number_of_rows: int
+    """
+    header = "{{'descr': '{}', 'fortran_order': False, 'shape': ({},), }}"\
+        .format(dtype, number_of_rows)
+    # The header is made up of the magic string, the version of the format,
+    # the length of the header and the header itself, padded with spaces and
+    # ending in a newline.
+    header_length = NPY_HEADER_SIZE - 10
+    file_object.write(b"\x93NUMPY\x01\x00"
+                    + header_length.to_bytes(2, "little")
+                    + header.ljust(header_length - 1).encode("latin1")
+                    + b"\n")
+
+def create_averages_writer(simulation_args, columns=AVERAGES_COLUMNS):
+    """
+    Creates the writer for the averages output in the format given by the
+    simulation arguments.
+
+    :param simulation_args: simulation_args
+    :type simulation_args: dict
+    :param columns: the result of create_averages_columns, if the species
+    are not hares and pumas
+    :type columns: tuple
+    :return: averages writer
+    :rtype: CsvAveragesWriter or BinaryAveragesWriter
+    """
+    if simulation_args['averages_format'] == "npy":
+        return BinaryAveragesWriter(simulation_args['averages_buffer_rows'],
+                                    columns=columns)
+    else:
+        return CsvAveragesWriter(simulation_args['averages_buffer_rows'],
+                                columns=columns)
+
+def load_averages(path):
+    """
+    Loads the averages written by a simulation, with the columns listed in
+    the manifest of the binary format or the header of a CSV file. The
+    columns of the binary format are memory-mapped rather than read in, so
+    even very long series are loaded without copying them.
+
+    :param path: averages.csv file or averages directory
+    :type path: str
+    :return: dictionary of column names and their values
+    :rtype: dict
+    """
+    if os.path.isdir(path):
+        with open(os.path.join(path, MANIFEST_FILE_NAME), "r") as \
+                file_object:
+            columns = [(column['name'], column['dtype']) for column
+                    in json.load(file_object)['columns']]
+        return {name : np.load(os.path.join(path, name.lower() + ".npy"),
+                            mmap_mode="r")
+                for name, _ in columns}
+
+    with open(path, "r") as file_object:
+        columns = create_averages_columns(
+            file_object.readline().strip().split(",")[2:])
+    values = np.loadtxt(path, delimiter=",", skiprows=1, ndmin=2)
+    return {name : values[:, column].astype(dtype)
+            for column, (name, dtype) in enumerate(columns)}
@@ -0,0 +1,95 @@
+from argparse import ArgumentParser
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+import simulation_arguments as sa
+
+
+# The simulation driver which is benchmarked.
+DRIVER = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                    "simulate_predator_prey.py")
+
+def get_benchmark_command_line_arguments():
+    """
+    Get command line arguments required to benchmark the distributed engine.
+
+    :return: parameters
+    :rtype: ArgumentParser
+    """
+    parameters = ArgumentParser(
+        description="Measure how the time taken by the distributed engine "
+                    "changes with the number of tiles")
+    parameters.add_argument("-f", "--landscape-file", type=str,
+                        required=True, help="Landscape file to run on")
+    parameters.add_argument("-d", "--duration", type=int, default=200,
+                        help="Time to run each simulation (in timesteps)")
+    parameters.add_argument("-t", "--time_step", type=int, default=100,
+                        help="Number of time steps at which to output files")
+    parameters.add_argument("-tl", "--tiles", type=sa.parse_tiles,
+                        nargs="+", default=[(1, 1), (1, 2), (2, 2)],
+                        metavar="ROWS,COLUMNS",
+                        help="Numbers of tiles to run with")
+    parameters.add_argument("-n", "--repeat", type=int, default=3,
+                        help="Number of times to run each number of tiles")
+    parameters.add_argument("-o", "--output", type=str, default=None,
+                        help="JSON file to write the timings to")
+
+    return parameters
+
+def run_driver(driver_args):
+    """
+    Runs the driver in a fresh interpreter in a temporary directory.
+
+    :param driver_args: driver_args
+    :type driver_args: list of type str
+    :return: wall time in seconds
+    :rtype: float
+    """
+    with tempfile.TemporaryDirectory() as directory:
+        start = time.perf_counter()
+        subprocess.run([sys.executable, DRIVER] + driver_args, cwd=directory,
+                    stdout=subprocess.DEVNULL, check=True)
+
+        return time.perf_counter() - start
+
+def benchmark():
+    # Get command line arguments from the terminal.
+    args = get_benchmark_command_line_arguments().parse_args()
+
+    simulation_argv = ["-f", os.path.abspath(args.landscape_file),
+                    "-d", str(args.duration), "-t", str(args.time_step)]
+
+    # Keep the fastest of the runs, as the others are slowed down by
+    # whatever else the machine is doing.
+    results = [{'engine' : "memory", 'workers' : 1,
+                'seconds' : min(run_driver(simulation_argv + ["-e", "memory"])
+                                for _ in range(args.repeat))}]
+    for tile_rows, tile_columns in args.tiles:
+        results.append({'engine' : "distributed",
+            'tiles' : "{},{}".format(tile_rows, tile_columns),
+            'workers' : tile_rows * tile_columns,
+            'seconds' : min(run_driver(simulation_argv
+                            + ["-e", "distributed", "-tl", "{},{}".format(
+                                tile_rows, tile_columns)])
+                            for _ in range(args.repeat))})
+
+    # The speed-up and efficiency are relative to the memory engine, which
+    # runs on a single core.
+    print("Engine       Tiles  Workers  Time (s)  Speed-up  Efficiency")
+    for result in results:
+        result['speed_up'] = results[0]['seconds'] / result['seconds']
+        result['efficiency'] = result['speed_up'] / result['workers']
+        print("{:12} {:5} {:8d} {:9.3f} {:8.2f}x {:10.0%}".format(
+            result['engine'], result.get('tiles', "-"), result['workers'],
+            result['seconds'], result['speed_up'], result['efficiency']))
+    print("Cores available: {}".format(os.cpu_count()))
+
+    if args.output is not None:
+        with open(args.output, "w") as file_object:
+            json.dump(results, file_object, indent=2)
+
+if __name__ == "__main__":
+    benchmark()
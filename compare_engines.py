@@ -0,0 +1,428 @@
+from argparse import ArgumentParser
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+import simulation_arguments as sa
+
+
+# The directory holding the simulation scripts.
+PACKAGE_DIRECTORY = os.path.dirname(os.path.abspath(__file__))
+
+# The engines which are compared, given as the command which runs each one
+# before the simulation arguments. The first engine is the reference the
+# others are checked against.
+ENGINES = {
+    'original' : [os.path.join(PACKAGE_DIRECTORY,
+                            "simulate_predator_prey_original.py")],
+    'memory' : [os.path.join(PACKAGE_DIRECTORY, "simulate_predator_prey.py"),
+                "-e", "memory"],
+    'out-of-core' : [os.path.join(PACKAGE_DIRECTORY,
+                                "simulate_predator_prey.py"),
+                    "-e", "out-of-core", "-br", "7"],
+    'distributed' : [os.path.join(PACKAGE_DIRECTORY,
+                                "simulate_predator_prey.py"),
+                    "-e", "distributed", "-tl", "2,3"],
+    'memory-reproducible' : [os.path.join(PACKAGE_DIRECTORY,
+                                        "simulate_predator_prey.py"),
+                            "-e", "memory", "-rp"],
+    'out-of-core-reproducible' : [os.path.join(PACKAGE_DIRECTORY,
+                                            "simulate_predator_prey.py"),
+                                "-e", "out-of-core", "-br", "3", "-rp"],
+    'distributed-reproducible' : [os.path.join(PACKAGE_DIRECTORY,
+                                            "simulate_predator_prey.py"),
+                                "-e", "distributed", "-tl", "3,2", "-rp"],
+    # The checks for stopping early, with a tolerance which is never
+    # reached and populations which never die out, so it runs to the end.
+    'memory-stop-checks' : [os.path.join(PACKAGE_DIRECTORY,
+                                        "simulate_predator_prey.py"),
+                            "-e", "memory", "-st", "1e-300", "-se"],
+    # A species file describing hares and pumas, written by
+    # create_species_file_arguments, in place of the rates of hares and
+    # pumas.
+    'memory-species-file' : [os.path.join(PACKAGE_DIRECTORY,
+                                        "simulate_predator_prey.py"),
+                            "-e", "memory"],
+    # A region covering the whole landscape, added by
+    # create_whole_region_arguments, whose map files should be the same as
+    # the map files of the whole landscape.
+    'memory-whole-region' : [os.path.join(PACKAGE_DIRECTORY,
+                                        "simulate_predator_prey.py"),
+                            "-e", "memory"],
+}
+
+# The width the names of the engines are displayed in.
+NAME_WIDTH = max(len(engine) for engine in ENGINES)
+
+# The sets of parameters each engine is run with, on top of the landscape
+# file, seeds and duration. Only parameters which the original accepts may
+# be used.
+PARAMETER_SETS = (
+    [],
+    ["-r", "0.1", "-a", "0.05", "-b", "0.03", "-m", "0.04"],
+    ["-k", "0.3", "-l", "0.1", "-dt", "0.2", "-t", "7"],
+)
+
+# A landscape with water squares, written to the working directory when no
+# landscape files are given, alongside map.dat.
+COASTAL_LANDSCAPE = """7 7
+1 1 1 1 1 1 1
+1 1 1 1 1 1 1
+1 1 1 1 0 1 1
+1 1 1 1 0 0 1
+1 1 1 0 0 0 0
+1 1 1 0 0 0 0
+1 0 0 0 0 0 0
+"""
+
+def get_comparison_command_line_arguments():
+    """
+    Get command line arguments required to compare the engines.
+
+    :return: parameters
+    :rtype: ArgumentParser
+    """
+    parameters = ArgumentParser(
+        description="Run every engine on a matrix of landscapes, parameters "
+                    "and seeds and check their output against the original")
+    parameters.add_argument("-f", "--landscape-file", type=str,
+                        action="append", default=[],
+                        help="Landscape file to run on; may be given more "
+                            "than once (default: map.dat and a landscape "
+                            "with water)")
+    parameters.add_argument("-s", "--seeds", type=int, nargs="+",
+                        default=[1, 42],
+                        help="Seeds to use for both hares and pumas")
+    parameters.add_argument("-d", "--duration", type=int, default=20,
+                        help="Time to run each simulation (in timesteps)")
+    parameters.add_argument("-e", "--engines", type=str, nargs="+",
+                        default=list(ENGINES), choices=list(ENGINES),
+                        help="Engines to compare, the first being the "
+                            "reference")
+    parameters.add_argument("--rtol", type=float, default=1e-9,
+                        help="Relative tolerance for averages")
+    parameters.add_argument("--atol", type=float, default=1e-12,
+                        help="Absolute tolerance for averages")
+    parameters.add_argument("--ppm-tolerance", type=int, default=1,
+                        help="Largest difference allowed in a map value")
+    parameters.add_argument("-o", "--output", type=str, default=None,
+                        help="JSON file to write the results and timings to")
+
+    return parameters
+
+def create_species_file_arguments(simulation_args, directory):
+    """
+    Writes a species file describing the hares and pumas of the given
+    simulation arguments to the given directory.
+
+    :param simulation_args: simulation_args
+    :type simulation_args: dict
+    :param directory: directory
+    :type directory: str
+    :return: the arguments giving the species file
+    :rtype: list of type str
+    """
+    description = {
+        'species' : [
+            {'name' : "Hares", 'seed' : simulation_args['hseed'],
+            'growth_rate' : simulation_args['birth_rate_hares'],
+            'diffusion_rate' : simulation_args['diffusion_rate_hares']},
+            {'name' : "Pumas", 'seed' : simulation_args['pseed'],
+            'growth_rate' : -simulation_args['death_rate_pumas'],
+            'diffusion_rate' : simulation_args['diffusion_rate_pumas']},
+        ],
+        'interactions' : [[0, -simulation_args['death_rate_hares']],
+                        [simulation_args['birth_rate_pumas'], 0]],
+    }
+    species_file = os.path.join(directory, "species.json")
+    with open(species_file, "w") as file_object:
+        json.dump(description, file_object)
+
+    return ["-sp", species_file]
+
+def create_whole_region_arguments(simulation_args, directory):
+    """
+    Creates the arguments giving a region which covers the whole landscape
+    of the given simulation arguments.
+
+    :param simulation_args: simulation_args
+    :type simulation_args: dict
+    :param directory: directory
+    :type directory: str
+    :return: the arguments giving the region
+    :rtype: list of type str
+    """
+    with open(simulation_args['landscape_file'], "r") as file_object:
+        width, height = [int(i) for i in file_object.readline().split(" ")]
+
+    return ["-rg", "0,0,{},{}".format(width, height)]
+
+# The functions which create the arguments added to the simulation arguments
+# for engines which describe the same simulation in another way.
+ENGINE_ARGUMENTS = {
+    'memory-species-file' : create_species_file_arguments,
+    'memory-whole-region' : create_whole_region_arguments,
+}
+
+# The endings of the names of the map files of engines which write them
+# under other names than the reference, before ".ppm".
+MAP_FILE_SUFFIXES = {
+    'memory-whole-region' : "_region_0",
+}
+
+def run_engine(engine, simulation_argv, directory):
+    """
+    Runs an engine in a fresh interpreter in the given directory.
+
+    :param engine: engine
+    :type engine: str
+    :param simulation_argv: simulation_argv
+    :type simulation_argv: list of type str
+    :param directory: directory
+    :type directory: str
+    :return: wall time in seconds, and a description of the error if the
+    engine failed or None
+    :rtype: tuple
+    """
+    start = time.perf_counter()
+    completed = subprocess.run([sys.executable] + ENGINES[engine]
+                            + simulation_argv, cwd=directory,
+                            stdout=subprocess.DEVNULL, stderr=subprocess.PIPE,
+                            text=True)
+    seconds = time.perf_counter() - start
+
+    if completed.returncode != 0:
+        # The last line of a traceback says what went wrong.
+        lines = completed.stderr.strip().splitlines()
+        return seconds, "exited with status {}{}".format(
+            completed.returncode, ": " + lines[-1] if lines else "")
+    return seconds, None
+
+def read_averages(directory):
+    """
+    Reads the averages.csv file in the given directory.
+
+    :param directory: directory
+    :type directory: str
+    :return: dictionary of timesteps and (time, hares, pumas)
+    :rtype: dict
+    """
+    averages = {}
+    with open(os.path.join(directory, "averages.csv"), "r") as file_object:
+        file_object.readline()
+        for line in file_object:
+            # Skip the comment recording why a simulation stopped early.
+            if line.startswith("#"):
+                continue
+            values = line.split(",")
+            averages[int(values[0])] = tuple(float(value)
+                                            for value in values[1:])
+
+    return averages
+
+def read_map_file(file_name):
+    """
+    Reads the dimensions and values of a plain PPM map file.
+
+    :param file_name: file_name
+    :type file_name: str
+    :return: list of all of the integers in the file after "P3"
+    :rtype: list
+    """
+    with open(file_name, "r") as file_object:
+        return [int(value) for value in file_object.read().split()[1:]]
+
+def find_map_files(directory, suffix=""):
+    """
+    Finds the map files in the given directory with names ending in the
+    given suffix and ".ppm".
+
+    :param directory: directory
+    :type directory: str
+    :param suffix: suffix
+    :type suffix: str
+    :return: dictionary of the names of the map files without the suffix and
+    their names
+    :rtype: dict
+    """
+    ending = suffix + ".ppm"
+    return {name[:-len(ending)] + ".ppm" : name
+            for name in os.listdir(directory) if name.endswith(ending)}
+
+def compare_outputs(reference_directory, directory, args, map_suffix=""):
+    """
+    Compares the averages and map files written by an engine with those
+    written by the reference engine.
+
+    :param reference_directory: reference_directory
+    :type reference_directory: str
+    :param directory: directory
+    :type directory: str
+    :param args: the parsed command-line arguments
+    :type args: Namespace
+    :param map_suffix: the ending of the names of the map files of the
+    engine, before ".ppm", which those of the reference do not have
+    :type map_suffix: str
+    :return: dictionary describing the differences
+    :rtype: dict
+    """
+    problems = []
+
+    reference_averages = read_averages(reference_directory)
+    averages = read_averages(directory)
+    if set(reference_averages) != set(averages):
+        problems.append("timesteps differ: {} in reference, {} here"
+            .format(sorted(reference_averages), sorted(averages)))
+    largest_difference = 0.0
+    for timestep in set(reference_averages) & set(averages):
+        for reference, value in zip(reference_averages[timestep],
+                                    averages[timestep]):
+            difference = abs(reference - value)
+            largest_difference = max(largest_difference, difference)
+            if difference > args.atol + args.rtol * abs(reference):
+                problems.append("averages differ at timestep {}"
+                                .format(timestep))
+                break
+
+    reference_maps = find_map_files(reference_directory)
+    maps = find_map_files(directory, map_suffix)
+    if sorted(reference_maps) != sorted(maps):
+        problems.append("map files differ: {} in reference, {} here"
+                        .format(sorted(reference_maps), sorted(maps.values())))
+    largest_map_difference = 0
+    for name in set(reference_maps) & set(maps):
+        reference = read_map_file(os.path.join(reference_directory, name))
+        values = read_map_file(os.path.join(directory, maps[name]))
+        if len(reference) != len(values) or reference[:3] != values[:3]:
+            problems.append("{} has different dimensions".format(name))
+            continue
+        map_difference = max(abs(a - b) for a, b in zip(reference, values))
+        largest_map_difference = max(largest_map_difference, map_difference)
+        if map_difference > args.ppm_tolerance:
+            problems.append("{} differs by up to {}".format(name,
+                                                        map_difference))
+
+    return {
+        'largest_averages_difference' : largest_difference,
+        'largest_map_difference' : largest_map_difference,
+        'problems' : problems,
+    }
+
+def compare():
+    # Get command line arguments from the terminal.
+    args = get_comparison_command_line_arguments().parse_args()
+
+    with tempfile.TemporaryDirectory() as working_directory:
+        landscape_files = [os.path.abspath(name)
+                        for name in args.landscape_file]
+        if not landscape_files:
+            coastal_file = os.path.join(working_directory, "coastal.dat")
+            with open(coastal_file, "w") as file_object:
+                file_object.write(COASTAL_LANDSCAPE)
+            landscape_files = [os.path.join(PACKAGE_DIRECTORY, "map.dat"),
+                            coastal_file]
+
+        results = []
+        case_number = 0
+        for landscape_file in landscape_files:
+            for parameters in PARAMETER_SETS:
+                for seed in args.seeds:
+                    case_number += 1
+                    simulation_argv = ["-f", landscape_file,
+                                    "-d", str(args.duration),
+                                    "-hs", str(seed), "-ps", str(seed)] \
+                                    + parameters
+                    simulation_args = sa.create_args_dictionary(
+                        sa.get_command_line_arguments(), simulation_argv)
+                    case = {'landscape_file' : landscape_file,
+                            'parameters' : parameters, 'seed' : seed,
+                            'engines' : {}}
+                    directories = {}
+                    for engine in args.engines:
+                        directories[engine] = os.path.join(working_directory,
+                            "case_{:03d}".format(case_number), engine)
+                        os.makedirs(directories[engine])
+                        engine_argv = simulation_argv
+                        if engine in ENGINE_ARGUMENTS:
+                            engine_argv = simulation_argv \
+                                + ENGINE_ARGUMENTS[engine](simulation_args,
+                                                        directories[engine])
+                        seconds, error = run_engine(engine, engine_argv,
+                                                directories[engine])
+                        result = {'seconds' : seconds, 'error' : error,
+                                'problems' : [error] if error else []}
+                        # Only compare the output of engines which ran, with
+                        # that of a reference which ran.
+                        reference = case['engines'].get(args.engines[0])
+                        if engine != args.engines[0] and error is None:
+                            if reference['error'] is not None:
+                                result['problems'].append(
+                                    "the reference failed")
+                            else:
+                                result.update(compare_outputs(
+                                    directories[args.engines[0]],
+                                    directories[engine], args,
+                                    MAP_FILE_SUFFIXES.get(engine, "")))
+                        case['engines'][engine] = result
+                    results.append(case)
+                    display_case(case, args.engines)
+
+    display_summary(results, args.engines)
+    if args.output is not None:
+        with open(args.output, "w") as file_object:
+            json.dump(results, file_object, indent=2)
+
+    # Fail if any engine failed or disagreed with the reference.
+    if any(result.get('problems') for case in results
+            for result in case['engines'].values()):
+        sys.exit(1)
+
+def display_case(case, engines):
+    """
+    Displays the timings and the outcome of the comparison for one case.
+
+    :param case: case
+    :type case: dict
+    :param engines: engines
+    :type engines: list of type str
+    """
+    print("{} {} seed {}".format(os.path.basename(case['landscape_file']),
+                                " ".join(case['parameters']) or "defaults",
+                                case['seed']))
+    for engine in engines:
+        result = case['engines'][engine]
+        if result['error'] is not None:
+            outcome = "FAILED: " + result['error']
+        elif engine == engines[0]:
+            outcome = "reference"
+        elif result['problems']:
+            outcome = "MISMATCH: " + "; ".join(result['problems'])
+        else:
+            outcome = "ok (averages within {:.1e}, maps within {})".format(
+                result['largest_averages_difference'],
+                result['largest_map_difference'])
+        print("    {:{}} {:8.3f} s  {}".format(engine, NAME_WIDTH,
+                                            result['seconds'], outcome))
+
+def display_summary(results, engines):
+    """
+    Displays the total time taken by each engine and its speed-up over the
+    reference.
+
+    :param results: results
+    :type results: list
+    :param engines: engines
+    :type engines: list of type str
+    """
+    totals = {engine : sum(case['engines'][engine]['seconds']
+                        for case in results)
+            for engine in engines}
+    print("Total time:")
+    for engine in engines:
+        print("    {:{}} {:8.3f} s  {:6.2f}x".format(engine, NAME_WIDTH,
+            totals[engine], totals[engines[0]] / totals[engine]))
+
+if __name__ == "__main__":
+    compare()
@@ -0,0 +1,167 @@
+import numpy as np
+
+
+# The number of squares of which the change is calculated at once. Blocks of
+# this size stay in the cache, rather than going out to memory and back as a
+# whole grid of changes would.
+CHANGE_BLOCK_SIZE = 65536
+
+class ConvergenceMonitor:
+    """
+    Watches the change in the population densities at each time step and
+    decides when the simulation can stop early: when every species has died
+    out everywhere, or when the largest change in the density of any species
+    in any square has stayed below a tolerance for a number of time steps in
+    a row.
+    """
+
+    def __init__(self, tolerance, window, stop_on_extinction):
+        self.tolerance = tolerance
+        self.window = max(1, window)
+        self.stop_on_extinction = stop_on_extinction
+        self.steps_below_tolerance = 0
+        self.reason = None
+        self.stopped_at = None
+        # The change in a block of rows, kept between time steps so that it
+        # is not allocated again at every one.
+        self.change = None
+
+    def check(self, i, populations, new_populations):
+        """
+        Checks the population densities calculated at a time step against
+        those they were calculated from.
+
+        :param i: i
+        :type i: int
+        :param populations: the densities of every species
+        :type populations: ndarray
+        :param new_populations: new_populations
+        :type new_populations: ndarray
+        :return: True if the simulation should stop
+        :rtype: bool
+        """
+        # Densities are never negative, so if the largest density is zero
+        # every square is empty.
+        if self.stop_on_extinction and not np.max(new_populations):
+            self.reason = "extinction"
+        elif self.tolerance > 0:
+            # The largest change in any square, for any species.
+            if self.calculate_largest_change(populations,
+                                        new_populations) < self.tolerance:
+                self.steps_below_tolerance += 1
+            else:
+                self.steps_below_tolerance = 0
+            if self.steps_below_tolerance >= self.window:
+                self.reason = "steady state"
+
+        if self.reason is not None:
+            self.stopped_at = i
+        return self.reason is not None
+
+    def calculate_largest_change(self, populations, new_populations):
+        """
+        Calculates the largest change in the density of any species in any
+        square, a block of rows at a time.
+
+        :param populations: populations
+        :type populations: ndarray
+        :param new_populations: new_populations
+        :type new_populations: ndarray
+        :return: largest change
+        :rtype: float
+        """
+        # The rows of every species, one species after another.
+        rows = populations.reshape(-1, populations.shape[-1])
+        new_rows = new_populations.reshape(rows.shape)
+        if self.change is None:
+            self.change = np.empty((max(1, CHANGE_BLOCK_SIZE // rows.shape[1]),
+                                    rows.shape[1]), rows.dtype)
+
+        largest_change = 0.0
+        for first in range(0, len(rows), len(self.change)):
+            change = self.change[:len(rows) - first]
+            np.subtract(new_rows[first:first + len(change)],
+                        rows[first:first + len(change)], out=change)
+            # The largest and smallest change give the largest absolute
+            # change without another pass over the block.
+            largest_change = max(largest_change, np.max(change),
+                                -np.min(change))
+        return largest_change
+
+    def calculate_steps_saved(self, total_times):
+        """
+        Calculates the number of time steps which were not run because the
+        simulation stopped early.
+
+        :param total_times: total_times
+        :type total_times: int
+        :return: number of time steps saved
+        :rtype: int
+        """
+        return total_times - 1 - self.stopped_at
+
+    def display_stop(self, total_times):
+        """
+        Displays why the simulation stopped early and how many time steps
+        were saved.
+
+        :param total_times: total_times
+        :type total_times: int
+        """
+        print("Stopped early. Timestep: {} Reason: {} Timesteps saved: {}"
+            .format(self.stopped_at, self.reason,
+                    self.calculate_steps_saved(total_times)))
+
+    def record_stop(self, total_times, averages_writer):
+        """
+        Records why the simulation stopped early and how many time steps
+        were saved in the averages output, so that it is kept with the
+        averages of runs nobody was watching.
+
+        :param total_times: total_times
+        :type total_times: int
+        :param averages_writer: averages_writer
+        :type averages_writer: CsvAveragesWriter or BinaryAveragesWriter
+        """
+        averages_writer.record_stop(self.stopped_at, self.reason,
+                                self.calculate_steps_saved(total_times))
+
+    def extrapolate_averages(self, simulation_args, total_times,
+                        averages_writer, averages):
+        """
+        Appends the averages at the time steps which would have been output
+        had the simulation not stopped early, taking them to stay as they
+        were when it stopped.
+
+        :param simulation_args: simulation_args
+        :type simulation_args: dict
+        :param total_times: total_times
+        :type total_times: int
+        :param averages_writer: averages_writer
+        :type averages_writer: CsvAveragesWriter or BinaryAveragesWriter
+        :param averages: the average of each species
+        :type averages: list
+        """
+        # The densities calculated at the last time step run are those of
+        # the following time step.
+        for i in range(self.stopped_at + 1, total_times):
+            if not i % simulation_args['time_step_number']:
+                averages_writer.append(i, simulation_args, *averages)
+
+def create_convergence_monitor(simulation_args):
+    """
+    Creates the convergence monitor asked for by the simulation arguments.
+
+    :param simulation_args: simulation_args
+    :type simulation_args: dict
+    :return: convergence monitor, or None if the simulation should never
+    stop early
+    :rtype: ConvergenceMonitor
+    """
+    if simulation_args['steady_state_tolerance'] <= 0 \
+            and not simulation_args['stop_on_extinction']:
+        return None
+
+    return ConvergenceMonitor(simulation_args['steady_state_tolerance'],
+                            simulation_args['steady_state_window'],
+                            simulation_args['stop_on_extinction'])
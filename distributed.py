@@ -0,0 +1,685 @@
+from argparse import ArgumentParser
+from concurrent.futures import ThreadPoolExecutor
+import json
+import os
+import socket
+import struct
+import subprocess
+import sys
+import time
+import numpy as np
+import simulation_functions as sf
+import simulation_arguments as sa
+import averages_output as ao
+import out_of_core
+import reductions
+
+
+# This script, which is started once for each worker.
+WORKER_SCRIPT = os.path.abspath(__file__)
+
+# The number of seconds the coordinator waits for all of the workers to
+# connect, and how often it checks whether the workers it started have
+# exited while it waits.
+WORKER_CONNECT_TIMEOUT = 60.0
+WORKER_CHECK_INTERVAL = 0.5
+
+# The directions of the neighbours of a tile, given as the offset of the
+# neighbouring tile in rows and columns of tiles.
+DIRECTIONS = {
+    'north' : (-1, 0),
+    'south' : (1, 0),
+    'west' : (0, -1),
+    'east' : (0, 1),
+}
+
+# The squares of a tile, including its "halo", which are sent to the
+# neighbour in each direction: its first or last row or column of land.
+EDGES = {
+    'north' : (1, slice(1, -1)),
+    'south' : (-2, slice(1, -1)),
+    'west' : (slice(1, -1), 1),
+    'east' : (slice(1, -1), -2),
+}
+
+# The squares of the halo of a tile which are received from the neighbour
+# in each direction. The corners of the halo are never needed, as only the
+# squares above, below, left and right of each square are.
+HALOS = {
+    'north' : (0, slice(1, -1)),
+    'south' : (-1, slice(1, -1)),
+    'west' : (slice(1, -1), 0),
+    'east' : (slice(1, -1), -1),
+}
+
+def send_message(connection, header, arrays=()):
+    """
+    Sends a message made of a header, encoded as JSON, followed by the
+    contents of any number of arrays, whose types and shapes are added to
+    the header.
+
+    :param connection: connection
+    :type connection: socket
+    :param header: header
+    :type header: dict
+    :param arrays: arrays
+    :type arrays: list of type ndarray
+    """
+    arrays = [np.ascontiguousarray(array) for array in arrays]
+    encoded_header = json.dumps(dict(header, arrays=[(array.dtype.str,
+                                    array.shape) for array in arrays])).encode()
+    connection.sendall(struct.pack("<I", len(encoded_header))
+                    + encoded_header)
+    for array in arrays:
+        connection.sendall(memoryview(array).cast("B"))
+
+def receive_exactly(connection, buffer):
+    """
+    Fills the buffer with data received from the connection.
+
+    :param connection: connection
+    :type connection: socket
+    :param buffer: buffer
+    :type buffer: bytearray or ndarray
+    """
+    view = memoryview(buffer).cast("B")
+    while len(view):
+        number_of_bytes = connection.recv_into(view)
+        if not number_of_bytes:
+            raise ConnectionError("Connection closed part way through a "
+                                "message")
+        view = view[number_of_bytes:]
+
+def receive_message(connection):
+    """
+    Receives a message sent with send_message.
+
+    :param connection: connection
+    :type connection: socket
+    :return: header and arrays
+    :rtype: tuple
+    """
+    length = bytearray(4)
+    receive_exactly(connection, length)
+    encoded_header = bytearray(struct.unpack("<I", length)[0])
+    receive_exactly(connection, encoded_header)
+    header = json.loads(encoded_header)
+
+    arrays = []
+    for dtype, shape in header['arrays']:
+        array = np.empty(shape, dtype)
+        receive_exactly(connection, array)
+        arrays.append(array)
+
+    return header, arrays
+
+def split_into_tiles(grid_dimensions, tile_rows, tile_columns):
+    """
+    Splits the landscape, not counting the "halo", into tile_rows by
+    tile_columns tiles of as near to the same size as possible.
+
+    :param grid_dimensions: grid_dimensions
+    :type grid_dimensions: list of type int
+    :param tile_rows: tile_rows
+    :type tile_rows: int
+    :param tile_columns: tile_columns
+    :type tile_columns: int
+    :return: list of (first row, row after last row, first column, column
+    after last column) in landscape squares including the halo, a row of
+    tiles at a time
+    :rtype: list
+    """
+    width = sf.get_width(grid_dimensions)
+    height = sf.get_height(grid_dimensions)
+    if tile_rows > height or tile_columns > width:
+        raise ValueError("A landscape of width {} and height {} cannot be "
+                        "split into {} by {} tiles".format(width, height,
+                                                        tile_rows,
+                                                        tile_columns))
+
+    rows = [1 + k * height // tile_rows for k in range(tile_rows + 1)]
+    columns = [1 + k * width // tile_columns for k in range(tile_columns + 1)]
+
+    return [(rows[r], rows[r + 1], columns[c], columns[c + 1])
+            for r in range(tile_rows) for c in range(tile_columns)]
+
+def find_neighbours(index, tile_rows, tile_columns):
+    """
+    Finds the tiles next to a tile.
+
+    :param index: index
+    :type index: int
+    :param tile_rows: tile_rows
+    :type tile_rows: int
+    :param tile_columns: tile_columns
+    :type tile_columns: int
+    :return: dictionary of directions and the index of the tile in that
+    direction, for each direction in which there is a tile
+    :rtype: dict
+    """
+    row, column = divmod(index, tile_columns)
+    neighbours = {}
+    for direction, (row_offset, column_offset) in DIRECTIONS.items():
+        if 0 <= row + row_offset < tile_rows \
+                and 0 <= column + column_offset < tile_columns:
+            neighbours[direction] = ((row + row_offset) * tile_columns
+                                    + column + column_offset)
+
+    return neighbours
+
+def calculate_tile_statistics(hares, pumas):
+    """
+    Calculates the sums and maxima of the densities of a tile, not counting
+    its "halo".
+
+    :param hares: hares
+    :type hares: ndarray
+    :param pumas: pumas
+    :type pumas: ndarray
+    :return: sum of hares, sum of pumas, maximum of hares and maximum of
+    pumas
+    :rtype: list
+    """
+    return [float(np.sum(hares)), float(np.sum(pumas)),
+            float(np.max(hares)), float(np.max(pumas))]
+
+def reduce_statistics(statistics, number_land_only_squares):
+    """
+    Combines the sums and maxima of every tile, always in the order of the
+    tiles rather than the order in which the workers reported them, so the
+    averages only depend on how the landscape is split into tiles.
+
+    :param statistics: the result of calculate_tile_statistics for each tile
+    :type statistics: list
+    :param number_land_only_squares: number_land_only_squares
+    :type number_land_only_squares: int
+    :return: average number of hares and pumas, and maximum number of hares
+    and pumas
+    :rtype: tuple
+    """
+    sums_and_maxima = [0.0, 0.0, 0.0, 0.0]
+    for tile_statistics in statistics:
+        sums_and_maxima = [sums_and_maxima[0] + tile_statistics[0],
+                        sums_and_maxima[1] + tile_statistics[1],
+                        max(sums_and_maxima[2], tile_statistics[2]),
+                        max(sums_and_maxima[3], tile_statistics[3])]
+
+    if number_land_only_squares != 0:
+        return (sums_and_maxima[0] / number_land_only_squares,
+                sums_and_maxima[1] / number_land_only_squares,
+                sums_and_maxima[2], sums_and_maxima[3])
+    return 0, 0, sums_and_maxima[2], sums_and_maxima[3]
+
+def reduce_reproducible_statistics(statistics, number_of_hares,
+                                number_of_pumas, number_land_only_squares):
+    """
+    Combines the maxima of every tile with the sums of the densities gathered
+    from the workers, added up in the same fixed order as the other engines,
+    so the averages do not depend on how the landscape is split into tiles.
+
+    :param statistics: the result of calculate_tile_statistics for each tile
+    :type statistics: list
+    :param number_of_hares: number_of_hares
+    :type number_of_hares: ndarray
+    :param number_of_pumas: number_of_pumas
+    :type number_of_pumas: ndarray
+    :param number_land_only_squares: number_land_only_squares
+    :type number_land_only_squares: int
+    :return: as for reduce_statistics
+    :rtype: tuple
+    """
+    # The maxima are the same whatever order they are combined in.
+    max_number_hares, max_number_pumas = reduce_statistics(
+        statistics, number_land_only_squares)[2:]
+
+    if number_land_only_squares != 0:
+        return (reductions.calculate_reproducible_sum(
+                    number_of_hares[1:-1, 1:-1]) / number_land_only_squares,
+                reductions.calculate_reproducible_sum(
+                    number_of_pumas[1:-1, 1:-1]) / number_land_only_squares,
+                max_number_hares, max_number_pumas)
+    return 0, 0, max_number_hares, max_number_pumas
+
+def split_into_regions(height, width):
+    """
+    Splits the squares of a tile into those next to its "halo", which its
+    neighbours need at the next time step, and those in its interior, which
+    only it needs.
+
+    :param height: height of the tile without the halo
+    :type height: int
+    :param width: width of the tile without the halo
+    :type width: int
+    :return: list of (rows, columns) of the boundary, and (rows, columns) of
+    the interior or None if there is no interior
+    :rtype: tuple
+    """
+    boundary = [(slice(1, 2), slice(1, width + 1))]
+    if height > 1:
+        boundary.append((slice(height, height + 1), slice(1, width + 1)))
+    if height > 2:
+        boundary.append((slice(2, height), slice(1, 2)))
+        if width > 1:
+            boundary.append((slice(2, height), slice(width, width + 1)))
+    interior = None
+    if height > 2 and width > 2:
+        interior = (slice(2, height), slice(2, width))
+
+    return boundary, interior
+
+class TileWorker:
+    """
+    Calculates the population densities of one tile of the landscape,
+    exchanging the squares along its edges with the workers of the
+    neighbouring tiles at every time step.
+
+    The boundary of the tile is calculated first and its edges are sent off
+    by another thread while the interior is calculated, so that the time
+    spent sending overlaps with the time spent calculating.
+    """
+
+    def __init__(self, header, arrays, connections):
+        self.time_step_size = header['time_step_size']
+        self.landscape, self.hares, self.pumas = arrays[:3]
+        self.new_hares = self.hares.copy()
+        self.new_pumas = self.pumas.copy()
+        self.land_neighbours = out_of_core.calculate_band_land_neighbours(
+            self.landscape)
+        self.connections = connections
+        self.sender = ThreadPoolExecutor(max_workers=1)
+
+        rates = dict(header['rates'])
+        rates.update(zip(header['raster_rates'], arrays[3:]))
+        boundary, interior = split_into_regions(self.landscape.shape[0] - 2,
+                                            self.landscape.shape[1] - 2)
+        self.boundary = [self.select_region(rows, columns, rates)
+                        for rows, columns in boundary]
+        self.interior = None
+        if interior is not None:
+            self.interior = self.select_region(*interior, rates)
+
+    def select_region(self, rows, columns, rates):
+        """
+        Selects the squares of a region of the tile, with the squares around
+        it, and the rates of the region.
+
+        :param rows: rows
+        :type rows: slice
+        :param columns: columns
+        :type columns: slice
+        :param rates: rates of the tile
+        :type rates: dict
+        :return: rows and columns including the squares around the region,
+        and the rates of the region
+        :rtype: tuple
+        """
+        return (slice(rows.start - 1, rows.stop + 1),
+                slice(columns.start - 1, columns.stop + 1),
+                {name : rate if np.isscalar(rate)
+                else rate[rows.start - 1:rows.stop - 1,
+                        columns.start - 1:columns.stop - 1]
+                for name, rate in rates.items()})
+
+    def calculate_region(self, region):
+        """
+        Calculates the new densities of a region of the tile.
+
+        :param region: the result of select_region
+        :type region: tuple
+        """
+        rows, columns, rates = region
+        sf.calculate_the_number_of_new_hares_and_pumas_vectorised(
+            self.landscape[rows, columns], self.new_hares[rows, columns],
+            self.hares[rows, columns], self.new_pumas[rows, columns],
+            self.pumas[rows, columns], {'time_step_size' :
+                                        self.time_step_size},
+            rates, self.land_neighbours[rows, columns])
+
+    def step(self):
+        """
+        Calculates the densities of the tile at the next time step and
+        receives the squares of its halo from its neighbours.
+        """
+        for region in self.boundary:
+            self.calculate_region(region)
+
+        sends = [self.sender.submit(send_message, connection, {},
+                    [np.stack((self.new_hares[EDGES[direction]],
+                            self.new_pumas[EDGES[direction]]))])
+                for direction, connection in self.connections.items()]
+
+        if self.interior is not None:
+            self.calculate_region(self.interior)
+
+        for direction, connection in self.connections.items():
+            halo = receive_message(connection)[1][0]
+            self.new_hares[HALOS[direction]] = halo[0]
+            self.new_pumas[HALOS[direction]] = halo[1]
+        for send in sends:
+            send.result()
+
+        self.hares, self.new_hares = self.new_hares, self.hares
+        self.pumas, self.new_pumas = self.new_pumas, self.pumas
+
+    def close(self):
+        """
+        Closes the connections to the neighbouring workers.
+        """
+        self.sender.shutdown()
+        for connection in self.connections.values():
+            connection.close()
+
+def connect_to_neighbours(index, neighbours, listener):
+    """
+    Opens a connection to each neighbouring worker. Each worker connects to
+    the neighbours with a higher index than its own and accepts connections
+    from those with a lower one.
+
+    :param index: index of the tile of this worker
+    :type index: int
+    :param neighbours: dictionary of directions and the index, host and
+    port of the neighbour in that direction
+    :type neighbours: dict
+    :param listener: listener
+    :type listener: socket
+    :return: dictionary of directions and connections
+    :rtype: dict
+    """
+    connections = {}
+    for direction, (neighbour, host, port) in neighbours.items():
+        if neighbour > index:
+            connection = socket.create_connection((host, port))
+            send_message(connection, {'tile' : index})
+            connections[direction] = connection
+
+    directions = {neighbour : direction
+                for direction, (neighbour, host, port) in neighbours.items()
+                if neighbour < index}
+    while len(connections) < len(neighbours):
+        connection = listener.accept()[0]
+        connections[directions[receive_message(connection)[0]['tile']]] = \
+            connection
+
+    for connection in connections.values():
+        connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+    return connections
+
+def run_worker(coordinator_address):
+    """
+    Connects to the coordinator of a distributed simulation, receives a tile
+    of the landscape and calculates it until told to stop.
+
+    :param coordinator_address: host and port of the coordinator
+    :type coordinator_address: tuple
+    """
+    coordinator = socket.create_connection(coordinator_address)
+    listener = socket.create_server((coordinator.getsockname()[0], 0))
+    send_message(coordinator, {'port' : listener.getsockname()[1]})
+
+    header, arrays = receive_message(coordinator)
+    worker = TileWorker(header, arrays, connect_to_neighbours(header['tile'],
+                                        header['neighbours'], listener))
+    listener.close()
+
+    while True:
+        command = receive_message(coordinator)[0]
+        if command['command'] == "stop":
+            break
+        for _ in range(command['steps']):
+            worker.step()
+
+        # Report the sums and maxima of the densities, and the densities
+        # themselves if the coordinator is writing map files.
+        hares = worker.hares[1:-1, 1:-1]
+        pumas = worker.pumas[1:-1, 1:-1]
+        send_message(coordinator,
+                    {'statistics' : calculate_tile_statistics(hares, pumas)},
+                    [hares, pumas] if command['gather'] else [])
+
+    worker.close()
+    coordinator.close()
+
+def start_workers(simulation_args, tiles, grid_dimensions, landscape,
+                number_of_hares, number_of_pumas, rates):
+    """
+    Waits for a worker to connect for each tile, starting them first unless
+    they are started elsewhere, and sends each its tile. If the workers do
+    not all connect within WORKER_CONNECT_TIMEOUT seconds, or a worker which
+    was started exits first, the workers are stopped and RuntimeError is
+    raised.
+
+    :param simulation_args: simulation_args
+    :type simulation_args: dict
+    :param tiles: the result of split_into_tiles
+    :type tiles: list
+    :param grid_dimensions: grid_dimensions
+    :type grid_dimensions: list of type int
+    :param landscape: landscape
+    :type landscape: ndarray
+    :param number_of_hares: number_of_hares
+    :type number_of_hares: ndarray
+    :param number_of_pumas: number_of_pumas
+    :type number_of_pumas: ndarray
+    :param rates: the result of sf.load_rates
+    :type rates: dict
+    :return: connections to the workers in the order of the tiles, and the
+    worker processes started
+    :rtype: tuple
+    """
+    listener = socket.create_server(simulation_args['coordinator_address'])
+    host, port = listener.getsockname()[:2]
+    print("Waiting for {} workers on {}:{}".format(len(tiles), host, port))
+
+    processes = []
+    if not simulation_args['external_workers']:
+        processes = [subprocess.Popen([sys.executable, WORKER_SCRIPT,
+                                    "{}:{}".format(host, port)])
+                    for _ in tiles]
+
+    # Tiles are given to the workers in the order in which they connect.
+    connections = []
+    worker_addresses = []
+    deadline = time.monotonic() + WORKER_CONNECT_TIMEOUT
+    listener.settimeout(WORKER_CHECK_INTERVAL)
+    try:
+        while len(connections) < len(tiles):
+            try:
+                connection, address = listener.accept()
+            except socket.timeout:
+                exited = [process for process in processes
+                        if process.poll() is not None]
+                if exited:
+                    raise RuntimeError("A worker exited with code {} before "
+                                    "connecting".format(exited[0].returncode))
+                if time.monotonic() > deadline:
+                    raise RuntimeError("Only {} of {} workers connected "
+                                    "within {} seconds".format(
+                                        len(connections), len(tiles),
+                                        WORKER_CONNECT_TIMEOUT))
+                continue
+            connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            connections.append(connection)
+            worker_addresses.append((address[0],
+                                    receive_message(connection)[0]['port']))
+    except BaseException:
+        for connection in connections:
+            connection.close()
+        for process in processes:
+            process.kill()
+            process.wait()
+        raise
+    finally:
+        listener.close()
+
+    tile_rows, tile_columns = simulation_args['tiles']
+    for index, (first_row, last_row, first_column, last_column) in \
+            enumerate(tiles):
+        rows = slice(first_row - 1, last_row + 1)
+        columns = slice(first_column - 1, last_column + 1)
+        raster_rates = [name for name in sa.RATE_NAMES
+                        if not np.isscalar(rates[name])]
+        header = {
+            'tile' : index,
+            'neighbours' : {direction : (neighbour,)
+                                        + worker_addresses[neighbour]
+                            for direction, neighbour in find_neighbours(
+                                index, tile_rows, tile_columns).items()},
+            'time_step_size' : simulation_args['time_step_size'],
+            'rates' : {name : rates[name] for name in sa.RATE_NAMES
+                    if name not in raster_rates},
+            'raster_rates' : raster_rates,
+        }
+        send_message(connections[index], header,
+                    [landscape[rows, columns], number_of_hares[rows, columns],
+                    number_of_pumas[rows, columns]]
+                    + [rates[name][first_row - 1:last_row - 1,
+                                first_column - 1:last_column - 1]
+                    for name in raster_rates])
+
+    return connections, processes
+
+def run_distributed_simulation(simulation_args, progress=None,
+                            should_stop=None):
+    """
+    Runs the simulation with the landscape split into tiles, each of which
+    is calculated by a separate worker process, possibly on another host.
+    Workers exchange the squares along the edges of their tiles with each
+    other over TCP at every time step, and only report to this process,
+    the coordinator, at the time steps at which output is written.
+
+    :param simulation_args: simulation_args
+    :type simulation_args: dict
+    :param progress: as for run_simulation
+    :type progress: function
+    :param should_stop: as for run_simulation, but only called at the time
+    steps at which output is written
+    :type should_stop: function
+    :return: True if the simulation ran to completion, False if it was
+    abandoned
+    :rtype: bool
+    """
+    sa.check_engine_options(simulation_args)
+
+    grid_dimensions, landscape = sf.create_simulation_landscape(
+        simulation_args)
+    number_land_only_squares = sf.calculate_number_land_only_squares(
+        landscape)
+    width = sf.get_width(grid_dimensions)
+    height = sf.get_height(grid_dimensions)
+    tiles = split_into_tiles(grid_dimensions, *simulation_args['tiles'])
+
+    # The initial densities are calculated here, in the same order and from
+    # the same random numbers as the other engines, and handed out to the
+    # workers. The densities are gathered back in here whenever map files
+    # are written.
+    number_of_hares = sf.calculate_number_hares(grid_dimensions, landscape,
+                                            simulation_args)
+    number_of_pumas = sf.calculate_number_pumas(grid_dimensions, landscape,
+                                            simulation_args)
+    rates = sf.load_rates(simulation_args, grid_dimensions)
+    statistics = [calculate_tile_statistics(
+                    number_of_hares[first_row:last_row,
+                                    first_column:last_column],
+                    number_of_pumas[first_row:last_row,
+                                    first_column:last_column])
+                for first_row, last_row, first_column, last_column in tiles]
+
+    # The densities are always gathered at the time steps at which the
+    # averages are written, so with reproducible on their sums are taken
+    # here rather than from the sums of the tiles.
+    if simulation_args['reproducible']:
+        def calculate_statistics():
+            return reduce_reproducible_statistics(statistics,
+                                        number_of_hares, number_of_pumas,
+                                        number_land_only_squares)
+    else:
+        def calculate_statistics():
+            return reduce_statistics(statistics, number_land_only_squares)
+
+    averages_writer = ao.create_averages_writer(simulation_args)
+    print("Averages. Timestep: {} Time (s): {} Hares: {} Pumas: {}".format(
+        0, 0, *calculate_statistics()[:2]))
+
+    total_times = sf.calculate_total_number_time_steps(simulation_args)
+    time_step_number = simulation_args['time_step_number']
+    completed = True
+    connections = []
+    processes = []
+    try:
+        connections, processes = start_workers(simulation_args, tiles,
+                                            grid_dimensions, landscape,
+                                            number_of_hares, number_of_pumas,
+                                            rates)
+        i = 0
+        while i < total_times:
+            if should_stop is not None and should_stop():
+                completed = False
+                break
+
+            if not i % time_step_number:
+                average_number_of_hares, average_number_of_pumas, \
+                    max_number_hares, max_number_pumas = \
+                    calculate_statistics()
+                sf.display_averages(i, simulation_args,
+                                average_number_of_hares,
+                                average_number_of_pumas)
+                if progress is not None:
+                    progress(i, simulation_args, average_number_of_hares,
+                            average_number_of_pumas)
+                averages_writer.append(i, simulation_args,
+                                    average_number_of_hares,
+                                    average_number_of_pumas)
+                # The map file is formatted all at once, as the workers wait
+                # for the coordinator while it is written.
+                sf.write_view_to_map_file("map_{:04d}.ppm".format(i),
+                    *sf.calculate_region_columns(landscape,
+                                    max_number_hares, number_of_hares,
+                                    max_number_pumas, number_of_pumas,
+                                    slice(1, height + 1), slice(1, width + 1)))
+
+            # Let the workers run up to the next time step at which output
+            # is written, gathering their densities if it is before the end.
+            steps = min(total_times, (i // time_step_number + 1)
+                        * time_step_number) - i
+            i += steps
+            gather = i < total_times
+            for connection in connections:
+                send_message(connection, {'command' : "run", 'steps' : steps,
+                                        'gather' : gather})
+            for index, connection in enumerate(connections):
+                header, arrays = receive_message(connection)
+                statistics[index] = header['statistics']
+                if gather:
+                    first_row, last_row, first_column, last_column = \
+                        tiles[index]
+                    number_of_hares[first_row:last_row,
+                                    first_column:last_column] = arrays[0]
+                    number_of_pumas[first_row:last_row,
+                                    first_column:last_column] = arrays[1]
+
+        for connection in connections:
+            send_message(connection, {'command' : "stop"})
+    finally:
+        for connection in connections:
+            connection.close()
+        for process in processes:
+            process.wait()
+        averages_writer.close()
+
+    return completed
+
+def work():
+    parameters = ArgumentParser(
+        description="Run a worker of a simulation using the distributed "
+                    "engine")
+    parameters.add_argument("coordinator_address", type=sa.parse_address,
+                        metavar="HOST:PORT",
+                        help="Address the coordinator is waiting for workers "
+                            "on")
+    args = parameters.parse_args()
+
+    run_worker(args.coordinator_address)
+
+if __name__ == "__main__":
+    work()
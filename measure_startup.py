@@ -0,0 +1,185 @@
+from argparse import ArgumentParser
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+
+# The simulation driver whose start-up time is measured.
+DRIVER = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                    "simulate_predator_prey.py")
+
+# The longest the fastest start-up may take by default. Showing the help
+# takes about 20 ms, and importing NumPy before the arguments are parsed
+# would take it well past this.
+MAX_SECONDS = 0.1
+
+# The longest the fastest start-up of a minimal simulation may take by
+# default. It takes about 65 ms, most of it importing NumPy, so this leaves
+# room for a slower machine but not for importing much more on top.
+MAX_RUN_SECONDS = 0.25
+
+# The landscape of the minimal simulation, which is run for no time steps
+# so that only its start-up and shut-down are measured.
+MINIMAL_LANDSCAPE = """2 2
+1 1
+1 1
+"""
+MINIMAL_RUN_ARGS = ["-f", "minimal.dat", "-d", "0"]
+
+def get_startup_command_line_arguments():
+    """
+    Get command line arguments required to measure the start-up time.
+
+    :return: parameters
+    :rtype: ArgumentParser
+    """
+    parameters = ArgumentParser(
+        description="Measure the cold start-up time of "
+                    "simulate_predator_prey.py")
+    parameters.add_argument("-n", "--repeat", type=int, default=5,
+                        help="Number of fresh interpreters to start")
+    parameters.add_argument("--top", type=int, default=10,
+                        help="Number of slowest imports to report")
+    parameters.add_argument("--max-seconds", type=float, default=None,
+                        help="Fail if the fastest start-up takes longer "
+                            "(0 for no limit; default: {} s with -h and {} s "
+                            "for a minimal simulation)".format(MAX_SECONDS,
+                                                        MAX_RUN_SECONDS))
+    parameters.add_argument("driver_args", nargs="*", default=[],
+                        help="Arguments given to the driver, after -- so "
+                            "that they are not taken as options of this "
+                            "script (default: measure both -h and a minimal "
+                            "simulation)")
+
+    return parameters
+
+def parse_import_times(stderr):
+    """
+    Parses the output of python -X importtime, which has one line per
+    imported module of the form
+    "import time: <self us> | <cumulative us> | <module>".
+
+    :param stderr: stderr
+    :type stderr: str
+    :return: list of (cumulative microseconds, self microseconds, module)
+    :rtype: list
+    """
+    import_times = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:"):
+            continue
+        fields = line[len("import time:"):].split("|")
+        if not fields[0].strip().isdigit():
+            # Skip the header line.
+            continue
+        import_times.append((int(fields[1]), int(fields[0]),
+                            fields[2].rstrip()))
+
+    return import_times
+
+def measure_startup(driver_args, directory=None):
+    """
+    Starts the driver in a fresh interpreter and measures how long it takes
+    to exit and how long each of its imports takes.
+
+    :param driver_args: driver_args
+    :type driver_args: list of type str
+    :param directory: directory to run the driver in, or None for the
+    current directory
+    :type directory: str
+    :return: wall time in seconds and the import times
+    :rtype: tuple
+    """
+    start = time.perf_counter()
+    completed = subprocess.run(
+        [sys.executable, "-X", "importtime", DRIVER] + driver_args,
+        cwd=directory, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE,
+        text=True)
+    wall_time = time.perf_counter() - start
+
+    # A driver which fails straight away would otherwise look fast.
+    if completed.returncode != 0:
+        raise RuntimeError("The driver exited with status {}:\n{}".format(
+            completed.returncode, "\n".join(line for line in
+                completed.stderr.splitlines()
+                if not line.startswith("import time:"))))
+
+    return wall_time, parse_import_times(completed.stderr)
+
+def report_startup(driver_args, max_seconds, args, directory=None):
+    """
+    Measures and displays the start-up time of the driver with the given
+    arguments, and its slowest imports.
+
+    :param driver_args: driver_args
+    :type driver_args: list of type str
+    :param max_seconds: the longest the fastest start-up may take, or 0 for
+    no limit
+    :type max_seconds: float
+    :param args: the parsed command-line arguments
+    :type args: Namespace
+    :param directory: as for measure_startup
+    :type directory: str
+    :return: True if the driver started within the limit
+    :rtype: bool
+    """
+    print("Driver arguments: {}".format(" ".join(driver_args)))
+
+    # Keep the fastest of the runs, as the others are slowed down by
+    # whatever else the machine is doing.
+    try:
+        wall_time, import_times = min(measure_startup(driver_args, directory)
+                                    for _ in range(args.repeat))
+    except RuntimeError as error:
+        print(error)
+        return False
+
+    print("Start-up time: {:.1f} ms (fastest of {})"
+        .format(wall_time * 1000, args.repeat))
+    print("Imports: {} modules, {:.1f} ms".format(len(import_times),
+        sum(self_time for _, self_time, _ in import_times) / 1000))
+    print("Slowest imports (cumulative ms | self ms | module):")
+    for cumulative_time, self_time, module in sorted(import_times,
+                                                reverse=True)[:args.top]:
+        print("{:10.1f} | {:8.1f} | {}".format(cumulative_time / 1000,
+                                            self_time / 1000, module))
+
+    # Fail if the start-up time has regressed beyond the given bound.
+    if max_seconds > 0 and wall_time > max_seconds:
+        print("Start-up time exceeds {} s".format(max_seconds))
+        return False
+    return True
+
+def report():
+    # Get command line arguments from the terminal.
+    args = get_startup_command_line_arguments().parse_args()
+
+    if args.driver_args:
+        max_seconds = MAX_SECONDS if args.max_seconds is None \
+            else args.max_seconds
+        passed = report_startup(args.driver_args, max_seconds, args)
+    else:
+        # Showing the help checks that the arguments are parsed before
+        # NumPy is imported, and a minimal simulation checks the start-up
+        # of a real run, which does import NumPy. The simulation is run in
+        # a temporary directory, as it writes averages.csv.
+        with tempfile.TemporaryDirectory() as directory:
+            with open(os.path.join(directory, "minimal.dat"), "w") as \
+                    file_object:
+                file_object.write(MINIMAL_LANDSCAPE)
+            passed = True
+            for driver_args, max_seconds in ((["-h"], MAX_SECONDS),
+                                        (MINIMAL_RUN_ARGS, MAX_RUN_SECONDS)):
+                if args.max_seconds is not None:
+                    max_seconds = args.max_seconds
+                passed = report_startup(driver_args, max_seconds, args,
+                                        directory) and passed
+                print()
+
+    if not passed:
+        sys.exit(1)
+
+if __name__ == "__main__":
+    report()
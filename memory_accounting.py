@@ -0,0 +1,351 @@
+from argparse import ArgumentParser
+import sys
+import numpy as np
+import simulation_arguments as sa
+import species
+
+try:
+    import resource
+except ImportError:
+    # The resource module is only available on Unix.
+    resource = None
+
+
+# The number of arrays of the size of all of the species which the update
+# of the in-memory engine holds at once while it is being calculated, on
+# top of the populations themselves.
+UPDATE_TEMPORARIES = 4
+
+# The number of grids of the size of a band or tile which the update of hares
+# and pumas by calculate_the_number_of_new_hares_and_pumas_vectorised holds
+# at once.
+TWO_SPECIES_UPDATE_TEMPORARIES = 8
+
+# The key of a plan listing the memory-mapped files of the simulation, whose
+# pages are held in the page cache, rather than the memory of a process.
+MAPPED_FILES = "mapped files"
+
+def get_peak_rss(children=False):
+    """
+    Gets the largest resident set size this process, or the largest of its
+    finished child processes, has had so far.
+
+    :param children: get the largest of the child processes instead
+    :type children: bool
+    :return: peak resident set size in bytes, or None if it is not known
+    :rtype: int
+    """
+    if resource is None:
+        return None
+
+    peak = resource.getrusage(resource.RUSAGE_CHILDREN if children
+                            else resource.RUSAGE_SELF).ru_maxrss
+    # Linux gives the peak in kilobytes and macOS in bytes.
+    if sys.platform == "darwin":
+        return peak
+    return peak * 1024
+
+def read_landscape_dimensions(landscape_file):
+    """
+    Reads the width and height of a landscape from the first line of its
+    file, without reading in the rest of the file.
+
+    :param landscape_file: landscape_file
+    :type landscape_file: str
+    :return: width and height
+    :rtype: tuple
+    """
+    with open(landscape_file, "r") as file_object:
+        width, height = [int(i) for i in file_object.readline().split(" ")]
+
+    return width, height
+
+def describe_species(simulation_args):
+    """
+    Finds the number of species in the simulation and the number of raster
+    files their rates are read from.
+
+    :param simulation_args: simulation_args
+    :type simulation_args: dict
+    :return: number of species and number of raster files
+    :rtype: tuple
+    """
+    if simulation_args['species_file'] is None:
+        number_of_species = 2
+        rates = {
+            'growth_rates' : [simulation_args['birth_rate_hares'],
+                            simulation_args['death_rate_pumas']],
+            'interactions' : [simulation_args['death_rate_hares'],
+                            simulation_args['birth_rate_pumas']],
+            'diffusion_rates' : [simulation_args['diffusion_rate_hares'],
+                                simulation_args['diffusion_rate_pumas']],
+        }
+    else:
+        description = species.read_species_file(
+            simulation_args['species_file'])
+        number_of_species = len(description['species'])
+        rates = {
+            'growth_rates' : [entry['growth_rate']
+                            for entry in description['species']],
+            'interactions' : [rate for row in description['interactions']
+                            for rate in row],
+            'diffusion_rates' : [entry['diffusion_rate']
+                                for entry in description['species']],
+        }
+
+    number_of_raster_files = len(set(value for values in rates.values()
+                                    for value in values
+                                    if isinstance(value, str)))
+
+    return number_of_species, number_of_raster_files
+
+def plan_memory(width, height, number_of_species=2, dtype=np.float64,
+                engine="memory", band_rows=256, tiles=(2, 2),
+                number_of_raster_files=0):
+    """
+    Lists the arrays each process of a simulation holds in memory at once
+    while it runs, including the largest temporary arrays of the update.
+
+    :param width: width
+    :type width: int
+    :param height: height
+    :type height: int
+    :param number_of_species: number_of_species
+    :type number_of_species: int
+    :param dtype: the type of the population densities
+    :type dtype: type
+    :param engine: engine
+    :type engine: str
+    :param band_rows: band_rows
+    :type band_rows: int
+    :param tiles: number of rows and columns of tiles
+    :type tiles: tuple
+    :param number_of_raster_files: number_of_raster_files
+    :type number_of_raster_files: int
+    :return: dictionary of processes and lists of (name, shape, dtype) of
+    the arrays each holds, and of MAPPED_FILES and a list of the files
+    memory-mapped by the simulation, if it maps any
+    :rtype: dict
+    """
+    # The landscape and the land neighbours are held as integers, except by
+    # the out-of-core engine.
+    integer = np.dtype(int)
+    species = number_of_species
+    halo = (height + 2, width + 2)
+
+    if engine == "memory":
+        plan = [
+            ("landscape", halo, integer),
+            ("land_neighbours", halo, integer),
+            ("populations", (species,) + halo, dtype),
+            ("new_populations", (species,) + halo, dtype),
+            ("hare_columns", (height, width), integer),
+            ("puma_columns", (height, width), integer),
+            # The rates of the species model are memory-mapped from the
+            # raster files, without being copied.
+            ("rate raster files", (number_of_raster_files, height, width),
+                np.dtype(np.float64)),
+            ("update temporaries", (UPDATE_TEMPORARIES, species, height,
+                                    width), dtype),
+            ("update masks", (species + 1, height, width), np.dtype(bool)),
+        ]
+        return {'simulation' : plan}
+
+    if engine == "out-of-core":
+        # Two bands are held at once, as the next band is read in while the
+        # current one is calculated. The pages of the state files which have
+        # been read or written are counted in the resident set size of the
+        # process, but they are page cache which the operating system can
+        # reclaim when it needs to, so they are listed apart from the memory
+        # the process needs.
+        band_rows = min(max(1, band_rows), height)
+        band = (band_rows + 2, width + 2)
+        return {'simulation' : [
+            ("landscape bands", (2,) + band, np.dtype(np.int8)),
+            ("population bands", (4,) + band, dtype),
+            ("new population bands", (2,) + band, dtype),
+            ("land_neighbours band", band, integer),
+            ("rate raster bands", (2 * number_of_raster_files, band_rows,
+                                width), np.dtype(np.float64)),
+            ("update temporaries", (TWO_SPECIES_UPDATE_TEMPORARIES,
+                                    band_rows, width), dtype),
+        ], MAPPED_FILES : [
+            ("mapped landscape file", halo, np.dtype(np.int8)),
+            ("mapped population files", (4,) + halo, dtype),
+        ]}
+
+    # The distributed engine holds the whole landscape in the coordinator,
+    # and a tile of it in each worker.
+    tile_rows, tile_columns = tiles
+    tile_height = -(-height // tile_rows)
+    tile_width = -(-width // tile_columns)
+    tile = (tile_height + 2, tile_width + 2)
+    return {
+        'coordinator' : [
+            ("landscape", halo, integer),
+            ("number_of_hares", halo, dtype),
+            ("number_of_pumas", halo, dtype),
+            ("hare_columns", (height, width), integer),
+            ("puma_columns", (height, width), integer),
+            ("rate raster files", (number_of_raster_files, height, width),
+                np.dtype(np.float64)),
+            ("initialisation temporary", halo, dtype),
+            ("message buffers", (3,) + tile, dtype),
+        ],
+        'each worker' : [
+            ("landscape", tile, integer),
+            ("land_neighbours", tile, integer),
+            ("populations", (4,) + tile, dtype),
+            ("message buffers", (2, tile_height, tile_width), dtype),
+            ("rate rasters", (number_of_raster_files, tile_height,
+                            tile_width), np.dtype(np.float64)),
+            ("update temporaries", (TWO_SPECIES_UPDATE_TEMPORARIES,
+                                    tile_height, tile_width), dtype),
+        ],
+    }
+
+def plan_simulation(simulation_args):
+    """
+    Lists the arrays each process of the simulation given by the simulation
+    arguments will hold in memory at once, without running it.
+
+    :param simulation_args: simulation_args
+    :type simulation_args: dict
+    :return: the result of plan_memory
+    :rtype: dict
+    """
+    width, height = read_landscape_dimensions(
+        simulation_args['landscape_file'])
+    number_of_species, number_of_raster_files = \
+        describe_species(simulation_args)
+
+    return plan_memory(width, height, number_of_species, np.float64,
+                    simulation_args['engine'], simulation_args['band_rows'],
+                    simulation_args['tiles'], number_of_raster_files)
+
+def calculate_plan_bytes(plan):
+    """
+    Calculates the number of bytes taken by the arrays of each process of a
+    plan, and by its memory-mapped files.
+
+    :param plan: the result of plan_memory
+    :type plan: dict
+    :return: dictionary of processes, and MAPPED_FILES, and numbers of bytes
+    :rtype: dict
+    """
+    return {process : sum(int(np.prod(shape)) * np.dtype(dtype).itemsize
+                        for _, shape, dtype in arrays)
+            for process, arrays in plan.items()}
+
+def format_bytes(number_of_bytes):
+    """
+    Formats a number of bytes in mebibytes.
+
+    :param number_of_bytes: number_of_bytes
+    :type number_of_bytes: int
+    :return: formatted number of bytes
+    :rtype: str
+    """
+    return "{:.1f} MiB".format(number_of_bytes / 2**20)
+
+def display_arrays(arrays):
+    """
+    Displays the shape, type and bytes taken by each of a list of arrays.
+
+    :param arrays: list of (name, shape, dtype) of the arrays
+    :type arrays: list of type tuple
+    """
+    for name, shape, dtype in arrays:
+        print("    {:24} {:>24} {:>8} {:>16,d} bytes".format(name,
+            str(tuple(shape)), np.dtype(dtype).name,
+            int(np.prod(shape)) * np.dtype(dtype).itemsize))
+
+def display_plan(plan, baseline):
+    """
+    Displays the bytes taken by each array of a plan, and the estimated peak
+    memory of each process. Memory-mapped files are displayed apart from,
+    and not counted in, the estimated peak, as their pages are page cache
+    which the operating system can reclaim.
+
+    :param plan: the result of plan_memory
+    :type plan: dict
+    :param baseline: resident set size of the interpreter and the modules of
+    the simulation, in bytes, or None if it is not known
+    :type baseline: int
+    """
+    plan_bytes = calculate_plan_bytes(plan)
+    for process, arrays in plan.items():
+        if process == MAPPED_FILES:
+            continue
+        print("Memory of {}:".format(process))
+        display_arrays(arrays)
+        print("    {:58} {:>16}".format("Arrays", format_bytes(
+            plan_bytes[process])))
+        if baseline is not None:
+            print("    {:58} {:>16}".format("Interpreter and modules",
+                                        format_bytes(baseline)))
+            print("    {:58} {:>16}".format("Estimated peak",
+                format_bytes(baseline + plan_bytes[process])))
+
+    if MAPPED_FILES in plan:
+        print("Memory-mapped files, held in reclaimable page cache:")
+        display_arrays(plan[MAPPED_FILES])
+        print("    {:58} {:>16}".format("Page cache, at most", format_bytes(
+            plan_bytes[MAPPED_FILES])))
+
+def display_peak_memory(plan, baseline):
+    """
+    Displays the measured peak memory of the simulation and of its workers,
+    if it had any, alongside the estimate. The measured peak of a
+    simulation which memory-maps files includes the pages of the files it
+    has read or written, which the estimate does not.
+
+    :param plan: the result of plan_memory
+    :type plan: dict
+    :param baseline: as for display_plan
+    :type baseline: int
+    """
+    if baseline is None:
+        return
+
+    plan_bytes = calculate_plan_bytes(plan)
+    for process, children in (('simulation', False), ('coordinator', False),
+                            ('each worker', True)):
+        if process in plan:
+            mapped = ""
+            if process == 'simulation' and MAPPED_FILES in plan:
+                mapped = ", plus up to {} of page cache".format(
+                    format_bytes(plan_bytes[MAPPED_FILES]))
+            print("Peak memory of {}: {} (estimated {}{})".format(process,
+                format_bytes(get_peak_rss(children)),
+                format_bytes(baseline + plan_bytes[process]), mapped))
+
+def plan():
+    parameters = ArgumentParser(
+        description="Estimate the peak memory of a simulation of a landscape "
+                    "of a given size, without a landscape file")
+    parameters.add_argument("width", type=int, help="Width of the landscape")
+    parameters.add_argument("height", type=int,
+                        help="Height of the landscape")
+    parameters.add_argument("-s", "--species", type=int, default=2,
+                        help="Number of species")
+    parameters.add_argument("--dtype", type=str, default="float64",
+                        help="Type of the population densities")
+    parameters.add_argument("-e", "--engine", type=str, default="memory",
+                        choices=("memory", "out-of-core", "distributed"),
+                        help="Engine the simulation is run with")
+    parameters.add_argument("-br", "--band-rows", type=int, default=256,
+                        help="Number of rows the out-of-core engine "
+                            "calculates at once")
+    parameters.add_argument("-tl", "--tiles", type=sa.parse_tiles,
+                        default=(2, 2), metavar="ROWS,COLUMNS",
+                        help="Number of rows and columns of tiles of the "
+                            "distributed engine")
+    args = parameters.parse_args()
+
+    display_plan(plan_memory(args.width, args.height, args.species,
+                            np.dtype(args.dtype), args.engine,
+                            args.band_rows, args.tiles), get_peak_rss())
+
+if __name__ == "__main__":
+    plan()
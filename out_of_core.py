@@ -0,0 +1,354 @@
+from concurrent.futures import ThreadPoolExecutor
+import os
+import random
+import numpy as np
+import simulation_functions as sf
+import simulation_arguments as sa
+import averages_output as ao
+import reductions
+
+
+def create_landscape_file(simulation_args):
+    """
+    Reads in the landscape file a line at a time into a memory-mapped
+    landscape.npy file in the state directory, with the "halo" added, so the
+    landscape never has to fit in memory.
+
+    :param simulation_args: simulation_args
+    :type simulation_args: dict
+    :return: grid_dimensions, landscape and number_land_only_squares
+    :rtype: tuple
+    """
+    with open(simulation_args['landscape_file'], "r") as file_object:
+        width, height = [int(i) for i in file_object.readline().split(" ")]
+        print("Width: {} Height: {}".format(width, height))
+
+        landscape = np.lib.format.open_memmap(
+            os.path.join(simulation_args['state_directory'], "landscape.npy"),
+            mode="w+", dtype=np.int8, shape=(height + 2, width + 2))
+        number_land_only_squares = 0
+        row = 1
+        for line in file_object:
+            if not line.strip():
+                continue
+            values = np.array(line.split(), dtype=np.int8)
+            landscape[row, 1:-1] = values
+            number_land_only_squares += np.count_nonzero(values)
+            row += 1
+
+    print("Number of land-only squares: {}".format(number_land_only_squares))
+    grid_dimensions = [width, height, width + 2, height + 2]
+
+    return grid_dimensions, landscape, number_land_only_squares
+
+def create_population_file(file_name, landscape, seed):
+    """
+    Creates a memory-mapped population density file, assigning a random
+    density between 0 and 5.0 to each land square a row at a time, in the
+    same order and from the same random numbers as calculate_number_hares
+    and calculate_number_pumas.
+
+    :param file_name: file_name
+    :type file_name: str
+    :param landscape: landscape
+    :type landscape: ndarray
+    :param seed: seed
+    :type seed: int
+    :return: population density grid
+    :rtype: ndarray
+    """
+    population = np.lib.format.open_memmap(file_name, mode="w+",
+                                        dtype=float, shape=landscape.shape)
+    random.seed(seed)
+    if seed != 0:
+        for x in range(1, landscape.shape[0] - 1):
+            land = landscape[x] != 0
+            population[x, land] = [random.uniform(0, 5.0)
+                                for _ in range(np.count_nonzero(land))]
+
+    return population
+
+def split_into_bands(height, band_rows):
+    """
+    Splits the rows of the landscape, not counting the "halo", into bands of
+    at most band_rows rows.
+
+    :param height: height
+    :type height: int
+    :param band_rows: band_rows
+    :type band_rows: int
+    :return: list of (first row, row after last row) in landscape rows
+    including the halo
+    :rtype: list
+    """
+    band_rows = max(1, band_rows)
+    return [(first, min(first + band_rows, height + 1))
+            for first in range(1, height + 1, band_rows)]
+
+def read_band(band, landscape, number_of_hares, number_of_pumas, rates):
+    """
+    Reads a band of rows into memory along with the row above and below it.
+
+    :param band: first row and row after last row
+    :type band: tuple
+    :param landscape: landscape
+    :type landscape: ndarray
+    :param number_of_hares: number_of_hares
+    :type number_of_hares: ndarray
+    :param number_of_pumas: number_of_pumas
+    :type number_of_pumas: ndarray
+    :param rates: the result of sf.load_rates
+    :type rates: dict
+    :return: landscape, hares, pumas and rates of the band
+    :rtype: tuple
+    """
+    first, last = band
+    band_rates = {name : rate if np.isscalar(rate)
+                else np.array(rate[first - 1:last - 1])
+                for name, rate in rates.items()}
+
+    return (np.array(landscape[first - 1:last + 1]),
+            np.array(number_of_hares[first - 1:last + 1]),
+            np.array(number_of_pumas[first - 1:last + 1]),
+            band_rates)
+
+def calculate_band_land_neighbours(landscape_band):
+    """
+    Calculates the number of land neighbours of each square of a band which
+    is not in its first or last row.
+
+    :param landscape_band: landscape_band
+    :type landscape_band: ndarray
+    :return: grid of the number of land neighbours
+    :rtype: ndarray
+    """
+    land_neighbours = np.zeros(landscape_band.shape, int)
+    land_neighbours[1:-1, 1:-1] = (landscape_band[:-2, 1:-1]
+                                + landscape_band[2:, 1:-1]
+                                + landscape_band[1:-1, :-2]
+                                + landscape_band[1:-1, 2:])
+
+    return land_neighbours
+
+def accumulate_sums_and_maxima(sums_and_maxima, hares, pumas,
+                            reproducible=False):
+    """
+    Adds the sums and maxima of the densities of a band to those of the bands
+    so far. The sums of the bands are kept, rather than added up as they go,
+    so that add_up_sums can add them up in a fixed order.
+
+    :param sums_and_maxima: sums of hares, sums of pumas, maximum of hares
+    and maximum of pumas
+    :type sums_and_maxima: list
+    :param hares: hares
+    :type hares: ndarray
+    :param pumas: pumas
+    :type pumas: ndarray
+    :param reproducible: keep the sum of each row of the band instead of the
+    sum of the band
+    :type reproducible: bool
+    :return: the updated sums and maxima
+    :rtype: list
+    """
+    if reproducible:
+        # The "halo" columns are left out, as they are by the other engines.
+        hare_sums = reductions.calculate_row_sums(hares[:, 1:-1])
+        puma_sums = reductions.calculate_row_sums(pumas[:, 1:-1])
+    else:
+        hare_sums = np.sum(hares)
+        puma_sums = np.sum(pumas)
+
+    return [sums_and_maxima[0] + [hare_sums],
+            sums_and_maxima[1] + [puma_sums],
+            max(sums_and_maxima[2], np.max(hares)),
+            max(sums_and_maxima[3], np.max(pumas))]
+
+def add_up_sums(sums, reproducible=False):
+    """
+    Adds up the sums kept by accumulate_sums_and_maxima.
+
+    :param sums: sums of the bands, or of the rows of the bands
+    :type sums: list
+    :param reproducible: as for accumulate_sums_and_maxima
+    :type reproducible: bool
+    :return: sum
+    :rtype: float
+    """
+    if reproducible:
+        return reductions.add_up_row_sums(sums)
+
+    # The sums of the bands are added up in the order of the bands.
+    total = 0.0
+    for band_sum in sums:
+        total = total + band_sum
+    return total
+
+def write_map_file(i, grid_dimensions, bands, landscape, number_of_hares,
+                number_of_pumas, max_number_hares, max_number_pumas):
+    """
+    Writes a map file in the same format as sf.write_columns_to_map_files,
+    reading in and writing out one band at a time.
+
+    :param i: i
+    :type i: int
+    :param grid_dimensions: grid_dimensions
+    :type grid_dimensions: list of type int
+    :param bands: bands
+    :type bands: list
+    :param landscape: landscape
+    :type landscape: ndarray
+    :param number_of_hares: number_of_hares
+    :type number_of_hares: ndarray
+    :param number_of_pumas: number_of_pumas
+    :type number_of_pumas: ndarray
+    :param max_number_hares: max_number_hares
+    :type max_number_hares: float
+    :param max_number_pumas: max_number_pumas
+    :type max_number_pumas: float
+    """
+    width = sf.get_width(grid_dimensions)
+    height = sf.get_height(grid_dimensions)
+
+    with open("map_{:04d}.ppm".format(i), "w") as file_object:
+        file_object.write("P3\n{} {}\n{}\n".format(width, height, 255))
+        for first, last in bands:
+            land, hare_columns, puma_columns = sf.calculate_region_columns(
+                landscape, max_number_hares, number_of_hares,
+                max_number_pumas, number_of_pumas, slice(first, last),
+                slice(1, width + 1))
+            pixels = np.stack((hare_columns, puma_columns,
+                            np.where(land, 0, 255)), axis=-1)
+            file_object.write(("{} {} {}\n" * land.size)
+                            .format(*pixels.ravel().tolist()))
+
+def run_out_of_core_simulation(simulation_args, progress=None,
+                            should_stop=None):
+    """
+    Runs the simulation with the landscape and the population densities of
+    hares and pumas held in memory-mapped files in the state directory
+    rather than in memory. Each time step is calculated a band of rows at a
+    time, reading in the next band while the current one is calculated, so
+    only a few bands are in memory at once.
+
+    :param simulation_args: simulation_args
+    :type simulation_args: dict
+    :param progress: as for run_simulation
+    :type progress: function
+    :param should_stop: as for run_simulation
+    :type should_stop: function
+    :return: True if the simulation ran to completion, False if it was
+    abandoned
+    :rtype: bool
+    """
+    sa.check_engine_options(simulation_args)
+
+    state_directory = simulation_args['state_directory']
+    os.makedirs(state_directory, exist_ok=True)
+    grid_dimensions, landscape, number_land_only_squares = \
+        create_landscape_file(simulation_args)
+    height = sf.get_height(grid_dimensions)
+    bands = split_into_bands(height, simulation_args['band_rows'])
+    rates = sf.load_rates(simulation_args, grid_dimensions)
+
+    # Two files are kept for each species: the densities at the current
+    # time step and those being calculated for the next one.
+    number_of_hares = create_population_file(
+        os.path.join(state_directory, "hares_0.npy"), landscape,
+        simulation_args['hseed'])
+    number_of_pumas = create_population_file(
+        os.path.join(state_directory, "pumas_0.npy"), landscape,
+        simulation_args['pseed'])
+    number_of_new_hares = np.lib.format.open_memmap(
+        os.path.join(state_directory, "hares_1.npy"), mode="w+",
+        dtype=float, shape=landscape.shape)
+    number_of_new_pumas = np.lib.format.open_memmap(
+        os.path.join(state_directory, "pumas_1.npy"), mode="w+",
+        dtype=float, shape=landscape.shape)
+
+    # The sums and maxima of the densities, used for the averages and the
+    # map files, are gathered band by band as the densities are calculated.
+    reproducible = simulation_args['reproducible']
+    sums_and_maxima = [[], [], 0.0, 0.0]
+    for first, last in bands:
+        sums_and_maxima = accumulate_sums_and_maxima(sums_and_maxima,
+                                            number_of_hares[first:last],
+                                            number_of_pumas[first:last],
+                                            reproducible)
+
+    def calculate_averages(sums_and_maxima):
+        if number_land_only_squares != 0:
+            return (add_up_sums(sums_and_maxima[0], reproducible)
+                    / number_land_only_squares,
+                    add_up_sums(sums_and_maxima[1], reproducible)
+                    / number_land_only_squares)
+        return 0, 0
+
+    averages_writer = ao.create_averages_writer(simulation_args)
+    average_number_of_hares, average_number_of_pumas = \
+        calculate_averages(sums_and_maxima)
+    print("Averages. Timestep: {} Time (s): {} Hares: {} Pumas: {}"
+        .format(0, 0, average_number_of_hares, average_number_of_pumas))
+
+    total_times = sf.calculate_total_number_time_steps(simulation_args)
+    completed = True
+    with ThreadPoolExecutor(max_workers=1) as prefetcher:
+        for i in range(0, total_times):
+            if should_stop is not None and should_stop():
+                completed = False
+                break
+
+            if not i % simulation_args['time_step_number']:
+                average_number_of_hares, average_number_of_pumas = \
+                    calculate_averages(sums_and_maxima)
+                sf.display_averages(i, simulation_args,
+                                average_number_of_hares,
+                                average_number_of_pumas)
+                if progress is not None:
+                    progress(i, simulation_args, average_number_of_hares,
+                            average_number_of_pumas)
+                averages_writer.append(i, simulation_args,
+                                    average_number_of_hares,
+                                    average_number_of_pumas)
+                write_map_file(i, grid_dimensions, bands, landscape,
+                            number_of_hares, number_of_pumas,
+                            sums_and_maxima[2], sums_and_maxima[3])
+
+            # Calculate the new densities a band at a time, reading in the
+            # next band while the current one is calculated.
+            sums_and_maxima = [[], [], 0.0, 0.0]
+            next_band = prefetcher.submit(read_band, bands[0], landscape,
+                                        number_of_hares, number_of_pumas,
+                                        rates)
+            for index, (first, last) in enumerate(bands):
+                landscape_band, hares_band, pumas_band, band_rates = \
+                    next_band.result()
+                if index + 1 < len(bands):
+                    next_band = prefetcher.submit(read_band,
+                        bands[index + 1], landscape, number_of_hares,
+                        number_of_pumas, rates)
+
+                new_hares_band = hares_band.copy()
+                new_pumas_band = pumas_band.copy()
+                sf.calculate_the_number_of_new_hares_and_pumas_vectorised(
+                    landscape_band, new_hares_band, hares_band,
+                    new_pumas_band, pumas_band, simulation_args, band_rates,
+                    calculate_band_land_neighbours(landscape_band))
+
+                number_of_new_hares[first:last] = new_hares_band[1:-1]
+                number_of_new_pumas[first:last] = new_pumas_band[1:-1]
+                sums_and_maxima = accumulate_sums_and_maxima(
+                    sums_and_maxima, new_hares_band[1:-1],
+                    new_pumas_band[1:-1], reproducible)
+
+            # Swap the files holding the densities at the current and next
+            # time steps.
+            number_of_hares, number_of_new_hares = \
+                number_of_new_hares, number_of_hares
+            number_of_pumas, number_of_new_pumas = \
+                number_of_new_pumas, number_of_pumas
+
+    averages_writer.close()
+    for grid in (number_of_hares, number_of_pumas):
+        grid.flush()
+
+    return completed
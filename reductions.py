@@ -0,0 +1,45 @@
+import math
+import numpy as np
+
+
+def calculate_row_sums(grid):
+    """
+    Calculates the sum of each row of a grid, adding up the squares of each
+    row pairwise in the order of the columns. The sum of a row only depends
+    on the row, not on which other rows are in the grid, so a band of rows
+    gives the same sums as the whole grid.
+
+    :param grid: grid, not including the "halo"
+    :type grid: ndarray
+    :return: sum of each row
+    :rtype: ndarray
+    """
+    return np.sum(grid, axis=1)
+
+def add_up_row_sums(row_sums):
+    """
+    Adds up the sums of rows, given as any number of arrays, with the result
+    correctly rounded, so it does not depend on how the rows were split up
+    or on the order in which the arrays are given.
+
+    :param row_sums: arrays of row sums, each the result of calculate_row_sums
+    :type row_sums: list of type ndarray
+    :return: sum of all of the rows
+    :rtype: float
+    """
+    if not row_sums:
+        return 0.0
+
+    return math.fsum(np.concatenate(row_sums).tolist())
+
+def calculate_reproducible_sum(grid):
+    """
+    Calculates the sum of a grid in a fixed order which gives the same result
+    however the grid is split into bands or tiles to be calculated.
+
+    :param grid: grid, not including the "halo"
+    :type grid: ndarray
+    :return: sum
+    :rtype: float
+    """
+    return add_up_row_sums([calculate_row_sums(grid)])
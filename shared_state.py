@@ -0,0 +1,222 @@
+from argparse import ArgumentParser
+from multiprocessing import resource_tracker, shared_memory
+import time
+import numpy as np
+
+
+# The layout of the shared memory segment: eight integers, eight floating
+# point numbers, then the hare and puma population densities, including the
+# "halo".
+INTEGER_FIELDS = ('sequence', 'timestep', 'height_including_halo',
+                'width_including_halo', 'number_land_only_squares')
+FLOAT_FIELDS = ('time', 'average_number_of_hares', 'average_number_of_pumas',
+                'max_number_hares', 'max_number_pumas')
+HEADER_SIZE = 128
+
+def create_views(buffer, grid_shape):
+    """
+    Creates numpy arrays viewing the fields of a shared memory segment,
+    without copying them.
+
+    :param buffer: buffer
+    :type buffer: memoryview
+    :param grid_shape: grid_shape
+    :type grid_shape: tuple
+    :return: integers, floats, hares and pumas
+    :rtype: tuple
+    """
+    grid_size = grid_shape[0] * grid_shape[1] * 8
+    return (np.ndarray((8,), np.int64, buffer, 0),
+            np.ndarray((8,), np.float64, buffer, 64),
+            np.ndarray(grid_shape, np.float64, buffer, HEADER_SIZE),
+            np.ndarray(grid_shape, np.float64, buffer,
+                    HEADER_SIZE + grid_size))
+
+class SharedStatePublisher:
+    """
+    Publishes the population densities of a running simulation, and a
+    summary of them, to a named shared memory segment.
+
+    The segment is guarded by a sequence number, which is odd while the
+    segment is being written and even otherwise, so readers can tell whether
+    what they read was written in between.
+    """
+
+    def __init__(self, name, grid_shape, number_land_only_squares):
+        self.shared_memory = shared_memory.SharedMemory(name, create=True,
+            size=HEADER_SIZE + 2 * grid_shape[0] * grid_shape[1] * 8)
+        self.integers, self.floats, self.hares, self.pumas = \
+            create_views(self.shared_memory.buf, grid_shape)
+        self.integers[:] = 0
+        self.floats[:] = 0
+        self.integers[2] = grid_shape[0]
+        self.integers[3] = grid_shape[1]
+        self.integers[4] = number_land_only_squares
+
+    def publish(self, i, simulation_args, number_of_hares, number_of_pumas,
+            average_number_of_hares, average_number_of_pumas):
+        """
+        Copies the population densities at a time step, and their summary,
+        into the shared memory segment.
+
+        :param i: i
+        :type i: int
+        :param simulation_args: simulation_args
+        :type simulation_args: dict
+        :param number_of_hares: number_of_hares
+        :type number_of_hares: ndarray
+        :param number_of_pumas: number_of_pumas
+        :type number_of_pumas: ndarray
+        :param average_number_of_hares: average_number_of_hares
+        :type average_number_of_hares: float
+        :param average_number_of_pumas: average_number_of_pumas
+        :type average_number_of_pumas: float
+        """
+        self.integers[0] += 1
+        self.integers[1] = i
+        self.floats[:5] = (i*simulation_args['time_step_size'],
+                        average_number_of_hares, average_number_of_pumas,
+                        np.max(number_of_hares), np.max(number_of_pumas))
+        np.copyto(self.hares, number_of_hares)
+        np.copyto(self.pumas, number_of_pumas)
+        self.integers[0] += 1
+
+    def close(self):
+        """
+        Removes the shared memory segment. Readers which are attached to it
+        can carry on reading the last state published.
+
+        The segment is removed even if it cannot be detached from, for
+        instance because the simulation failed while views of it were still
+        held, as it would otherwise outlive the process.
+        """
+        if self.shared_memory is None:
+            return
+        try:
+            del self.integers, self.floats, self.hares, self.pumas
+            self.shared_memory.close()
+        finally:
+            self.shared_memory.unlink()
+            self.shared_memory = None
+
+class SharedStateReader:
+    """
+    Reads the state published by a SharedStatePublisher in another process.
+    """
+
+    def __init__(self, name):
+        try:
+            self.shared_memory = shared_memory.SharedMemory(name,
+                                                        track=False)
+        except TypeError:
+            # Before Python 3.13 the segment is tracked, and would be
+            # removed when this process exits, unless it is untracked.
+            self.shared_memory = shared_memory.SharedMemory(name)
+            resource_tracker.unregister(self.shared_memory._name,
+                                        "shared_memory")
+        integers = np.ndarray((8,), np.int64, self.shared_memory.buf, 0)
+        self.integers, self.floats, self.hares, self.pumas = \
+            create_views(self.shared_memory.buf,
+                        (int(integers[2]), int(integers[3])))
+
+    def read(self, copy=True):
+        """
+        Reads a consistent state, trying again if the publisher was writing
+        to the segment while it was read.
+
+        Without copying, the hare and puma grids returned are views of the
+        segment which the publisher will overwrite, so they are only
+        consistent until the next call of is_current returns False.
+
+        :param copy: copy the grids out of the segment
+        :type copy: bool
+        :return: sequence number, dictionary of the summary, hares and pumas
+        :rtype: tuple
+        """
+        while True:
+            sequence = int(self.integers[0])
+            if sequence % 2:
+                # The publisher is part way through writing.
+                continue
+            summary = dict(zip(INTEGER_FIELDS[1:], self.integers[1:5]
+                            .tolist()))
+            summary.update(zip(FLOAT_FIELDS, self.floats[:5].tolist()))
+            hares = self.hares.copy() if copy else self.hares
+            pumas = self.pumas.copy() if copy else self.pumas
+            if self.is_current(sequence):
+                return sequence, summary, hares, pumas
+
+    def is_current(self, sequence):
+        """
+        Checks whether the segment still holds the state read with the given
+        sequence number.
+
+        :param sequence: sequence
+        :type sequence: int
+        :return: True if nothing has been published since
+        :rtype: bool
+        """
+        return int(self.integers[0]) == sequence
+
+    def close(self):
+        """
+        Detaches from the shared memory segment.
+        """
+        del self.integers, self.floats, self.hares, self.pumas
+        self.shared_memory.close()
+
+def create_state_publisher(simulation_args, grid_dimensions,
+                        number_land_only_squares):
+    """
+    Creates the publisher for the shared memory segment given by the
+    simulation arguments.
+
+    :param simulation_args: simulation_args
+    :type simulation_args: dict
+    :param grid_dimensions: grid_dimensions
+    :type grid_dimensions: list of type int
+    :param number_land_only_squares: number_land_only_squares
+    :type number_land_only_squares: int
+    :return: publisher, or None if no segment was asked for
+    :rtype: SharedStatePublisher
+    """
+    if simulation_args['shared_memory'] is None:
+        return None
+
+    return SharedStatePublisher(simulation_args['shared_memory'],
+                            (grid_dimensions[3], grid_dimensions[2]),
+                            number_land_only_squares)
+
+def inspect():
+    parameters = ArgumentParser(
+        description="Display the state of a simulation run with "
+                    "--shared-memory")
+    parameters.add_argument("name", type=str,
+                        help="Name of the shared memory segment")
+    parameters.add_argument("-w", "--watch", type=float, default=None,
+                        help="Keep displaying the state every this many "
+                            "seconds")
+    args = parameters.parse_args()
+
+    reader = SharedStateReader(args.name)
+    last_sequence = None
+    try:
+        while True:
+            sequence, summary = reader.read(copy=False)[:2]
+            if sequence != last_sequence:
+                print(("Timestep: {timestep} Time (s): {time} "
+                    "Hares: {average_number_of_hares} "
+                    "Pumas: {average_number_of_pumas} "
+                    "Max hares: {max_number_hares} "
+                    "Max pumas: {max_number_pumas}").format(**summary))
+                last_sequence = sequence
+            if args.watch is None:
+                break
+            time.sleep(args.watch)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        reader.close()
+
+if __name__ == "__main__":
+    inspect()
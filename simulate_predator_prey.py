@@ -1,114 +1,288 @@
-from argparse import ArgumentParser
-import numpy as np
-import random
-import time
-import simulation_functions as sf
+import simulation_arguments as sa
 
 
 def sim():
     # Get command line arguments from the terminal.
-    command_line_args = sf.get_command_line_arguments()
+    command_line_args = sa.get_command_line_arguments()
 
-    # Store the command line arguments in a dictionary.
-    simulation_args = sf.create_args_dictionary(command_line_args)
+    # Store the command line arguments in a dictionary. This is done before
+    # numpy is imported, so that showing help or rejecting invalid arguments
+    # is quick.
+    simulation_args = sa.create_args_dictionary(command_line_args)
 
-    # Create the simulation landscape as a numpy array and store the 
-    # dimensions of the landscape in a list.
-    grid_dimensions, landscape = \
-        sf.create_simulation_landscape(simulation_args)
+    # Work out which arrays the simulation will hold in memory, reading the
+    # species file if one is given, and reject options the engine does not
+    # support, or a species file or regions which cannot be simulated, now 
+    # rather than once the simulation has started writing its output.
+    import memory_accounting as ma
+    try:
+        sa.check_engine_options(simulation_args)
+        memory_plan = ma.plan_simulation(simulation_args)
+        sa.check_regions(simulation_args['regions'],
+            *ma.read_landscape_dimensions(simulation_args['landscape_file']))
+    except ValueError as error:
+        command_line_args.error(str(error))
+
+    # Measure the memory taken by the interpreter and numpy before the
+    # simulation starts.
+    baseline = ma.get_peak_rss()
+
+    # Only show how much memory the simulation would take, if asked to.
+    if simulation_args['dry_run']:
+        ma.display_plan(memory_plan, baseline)
+        return
+
+    # Run the simulation with the given arguments.
+    run_simulation(simulation_args)
+
+    # Show how much memory the simulation took.
+    ma.display_peak_memory(memory_plan, baseline)
+
+def run_simulation(simulation_args, prepared_landscape=None, progress=None, 
+                should_stop=None):
+    """
+    Runs the simulation for the given simulation arguments, writing the
+    averages.csv file and the map files to the current directory.
+
+    :param simulation_args: simulation_args
+    :type simulation_args: dict
+    :param prepared_landscape: the result of sf.prepare_landscape for the
+    landscape file, or None to read in the landscape file
+    :type prepared_landscape: tuple
+    :param progress: function called with the same arguments as
+    sf.display_averages every time the averages are calculated, or None
+    :type progress: function
+    :param should_stop: function called at every time step which returns True
+    if the simulation should be abandoned, or None
+    :type should_stop: function
+    :return: True if the simulation ran to completion, False if it was 
+    abandoned
+    :rtype: bool
+    """
+    # numpy and the simulation functions are only imported once there is a
+    # simulation to run, and the modules for optional output and stopping
+    # early only if they have been asked for.
+    import numpy as np
+    import simulation_functions as sf
+    import averages_output as ao
+    import species
+
+    # Hand landscapes which are too large for memory to the out-of-core
+    # engine.
+    if simulation_args['engine'] == "out-of-core":
+        import out_of_core
+        return out_of_core.run_out_of_core_simulation(simulation_args, 
+                                                    progress, should_stop)
+
+    # Spread the landscape over worker processes with the distributed
+    # engine.
+    if simulation_args['engine'] == "distributed":
+        import distributed
+        return distributed.run_distributed_simulation(simulation_args, 
+                                                    progress, should_stop)
+
+    # Create the simulation landscape as a numpy array, store the 
+    # dimensions of the landscape in a list, calculate the number of squares
+    # in the landscape which are land squares rather than water or "halo" 
+    # squares and calculate the number of land neighbours of each square in
+    # the landscape, unless this has already been done.
+    if prepared_landscape is None:
+        prepared_landscape = sf.prepare_landscape(simulation_args)
+    grid_dimensions, landscape, number_land_only_squares, land_neighbours = \
+        prepared_landscape
 
     # Get the individual dimensions of the landscape required for the 
     # simulation.
     width = sf.get_width(grid_dimensions)
     height = sf.get_height(grid_dimensions)
 
-    # Calculate the number of squares in the landscape which are land squares
-    # rather than water or "halo" squares.
-    number_land_only_squares = \
-        sf.calculate_number_land_only_squares(landscape)
-
-    # Calculate the number of land neighbours of each square in the landscape.
-    land_neighbours = \
-        sf.create_land_neighbours_grid(grid_dimensions, landscape)
+    # Check the regions before any output is written, as sim does for 
+    # simulations which were not started from the command line.
+    sa.check_regions(simulation_args['regions'], width, height)
     
-    # Create a numpy array representing the population density of hares in
-    # the simulation landscape.
-    number_of_hares = sf.calculate_number_hares(grid_dimensions, landscape, 
-                        simulation_args)
-    
-    # Create a numpy array representing the population density of pumas in
-    # the simulation landscape.
-    number_of_pumas = sf.calculate_number_pumas(grid_dimensions, landscape, 
-                        simulation_args)
+    # Get the species in the simulation, hares and pumas unless a species
+    # file is given, along with their birth, death, interaction and 
+    # diffusion rates, reading in any which are given as a rate for each
+    # square of the landscape.
+    species_model = species.create_species_model(simulation_args, 
+                                            grid_dimensions)
+
+    # Create a numpy array representing the population densities of every
+    # species in the simulation landscape, one species after another.
+    populations = species.create_populations(grid_dimensions, landscape, 
+                                        species_model)
+
+    # The first two species, hares and pumas unless a species file is given,
+    # are those shown in the map files.
+    number_of_hares, number_of_pumas = populations[0], populations[1]
     
-    # Print the initial average number of hares and pumas and store them in
-    # the averages.csv file.
-    sf.initialise_averages_file(number_of_hares, number_of_pumas, 
-                            number_land_only_squares)
+    # Print the initial average density of each species.
+    species.display_averages(0, 0, species_model, 
+        species.calculate_averages(populations, number_land_only_squares,
+                                simulation_args['reproducible']))
 
     # Calculate the total number of time steps over which the simulation will 
     # be executed.
     total_times = sf.calculate_total_number_time_steps(simulation_args)
 
-    # Initialise copies of the population densities of hares and pumas in the 
-    # landscape.
-    number_of_new_hares, number_of_new_pumas, hare_columns, puma_columns = \
-        sf.create_grid_copies(grid_dimensions, number_of_hares, 
-                            number_of_pumas)
-
-    # Loop through all of the time steps.
-    for i in range(1, total_times):
-        # Check if the modulus of i and the current time step is zero.
-        if not i % simulation_args['time_step_number']:
-            # Calculate the maximum number of hares and pumas.
-            max_number_hares = np.max(number_of_hares)
-            max_number_pumas = np.max(number_of_pumas)
-
-            # Calcualte the average numbers of hares and pumas in the 
-            # landscape at the current time step.
-            average_number_of_hares, average_number_of_pumas = \
-                sf.calculate_averages(number_of_hares, 
-                            number_of_pumas, 
-                            number_land_only_squares)
-
-            # Display the average number of hares and pumas at the present 
-            # timestep.
-            sf.display_averages(i, simulation_args, average_number_of_hares, 
-                            average_number_of_pumas)
-
-            # Append the average number of hares and pumas and the 
-            # corresponding timestep and time in seconds to the averages.csv 
-            # file.
-            sf.append_averages_to_file(i, simulation_args, 
-                                    average_number_of_hares, 
-                                    average_number_of_pumas)
-
-            # Generate columns of hare and puma population values to be 
-            # written to map files.
-            hare_columns, puma_columns = \
-                sf.generate_hare_and_puma_columns(width, height, 
+    # Initialise a copy of the population densities of every species in the 
+    # landscape, and the columns of the map files.
+    new_populations = populations.copy()
+    hare_columns = np.zeros((height, width), int)
+    puma_columns = np.zeros((height, width), int)
+
+    # Create the monitor which decides whether the simulation can stop
+    # before all of the time steps have been run, if it can.
+    convergence_monitor = None
+    if simulation_args['steady_state_tolerance'] > 0 or \
+            simulation_args['stop_on_extinction']:
+        import convergence
+        convergence_monitor = convergence.create_convergence_monitor(
+            simulation_args)
+
+    # The writers and the publisher are closed however the simulation ends,
+    # so that the averages and the animation are written out, and the shared
+    # memory segment is removed, even if it fails part way through.
+    averages_writer = None
+    animation_writer = None
+    state_publisher = None
+    try:
+        # Create the writer which holds the averages in memory and writes
+        # them out a block at a time, in the format given by the simulation
+        # arguments.
+        averages_writer = ao.create_averages_writer(simulation_args, 
+                        ao.create_averages_columns(species_model['names']))
+
+        # Create the writer which adds a frame to the animation file, if one
+        # was asked for, every time the map files would be written.
+        if simulation_args['animation_file'] is not None:
+            import animation_output as an
+            animation_writer = an.create_animation_writer(simulation_args, 
+                                                    grid_dimensions)
+
+        # Create the publisher which lets other processes see the state of
+        # the simulation while it runs, if a shared memory segment was asked
+        # for.
+        if simulation_args['shared_memory'] is not None:
+            import shared_state
+            state_publisher = shared_state.create_state_publisher(
+                simulation_args, grid_dimensions, number_land_only_squares)
+
+        # Loop through all of the time steps.
+        completed = True
+        for i in range(0, total_times):
+            # Abandon the simulation if it has been asked to stop.
+            if should_stop is not None and should_stop():
+                completed = False
+                break
+
+            # Check if the modulus of i and the current time step is zero.
+            if not i % simulation_args['time_step_number']:
+                # Calculate the maximum number of hares and pumas.
+                max_number_hares = np.max(number_of_hares)
+                max_number_pumas = np.max(number_of_pumas)
+
+                # Calcualte the average density of each species in the 
+                # landscape at the current time step.
+                averages = species.calculate_averages(populations, 
+                                        number_land_only_squares,
+                                        simulation_args['reproducible'])
+
+                # Display the average density of each species at the present 
+                # timestep.
+                species.display_averages(i, 
+                    i*simulation_args['time_step_size'], species_model, 
+                    averages)
+                if progress is not None:
+                    progress(i, simulation_args, averages[0], averages[1])
+
+                # Append the average density of each species and the 
+                # corresponding timestep and time in seconds to the averages.
+                averages_writer.append(i, simulation_args, *averages)
+
+                # If regions of the landscape or a reduced landscape have 
+                # been asked for, write map files of only those.
+                if simulation_args['regions'] or \
+                        simulation_args['downsample'] > 1:
+                    sf.write_map_views(i, simulation_args, grid_dimensions, 
+                                landscape, max_number_hares, number_of_hares, 
+                                max_number_pumas, number_of_pumas)
+                elif animation_writer is None:
+                    # Generate columns of hare and puma population values to 
+                    # be written to map files.
+                    hare_columns, puma_columns = \
+                        sf.generate_hare_and_puma_columns(width, height, 
                                     max_number_hares, number_of_hares, 
                                     max_number_pumas, number_of_pumas, 
                                     landscape, hare_columns, puma_columns)
 
-            # Write the columns of hare and puma population data to map files.
-            sf.write_columns_to_map_files(i, width, height, landscape, 
-                                        hare_columns, puma_columns)
-
-        # Calculate the number of new hares and pumas.
-        number_of_new_hares, number_of_new_pumas = \
-            sf.calculate_the_number_of_new_hares_and_pumas(width, height, 
-                                            landscape, number_of_new_hares, 
-                                            number_of_hares, 
-                                            number_of_new_pumas, 
-                                            number_of_hares, simulation_args, 
-                                            land_neighbours)
-                                            
-        # Switch the old population densities of hares and pumas with the new 
-        # population densities of hares and pumas for the next iteration of
-        # the simulation.
-        sf.swap_array_for_next_iteration(number_of_hares, number_of_pumas, 
-                                    number_of_new_hares, number_of_new_pumas)
+                    # Write the columns of hare and puma population data to 
+                    # map files.
+                    sf.write_columns_to_map_files(i, width, height, 
+                                    landscape, hare_columns, puma_columns)
+
+                # Add the whole landscape to the animation, in place of its 
+                # map file.
+                if animation_writer is not None:
+                    animation_writer.add_frame(an.create_frame(
+                        *sf.calculate_region_columns(landscape, 
+                                max_number_hares, number_of_hares, 
+                                max_number_pumas, number_of_pumas, 
+                                slice(1, height + 1), slice(1, width + 1))))
+
+            # Publish the state at the current time step to shared memory,
+            # reusing the averages if they have just been calculated for the
+            # output.
+            if state_publisher is not None and \
+                    not i % simulation_args['publish_interval']:
+                if i % simulation_args['time_step_number']:
+                    averages = sf.calculate_averages(number_of_hares, 
+                                number_of_pumas, number_land_only_squares)
+                state_publisher.publish(i, simulation_args, number_of_hares, 
+                    number_of_pumas, averages[0], averages[1])
+
+            # Calculate the new population densities of every species for all
+            # of the squares of the landscape at once.
+            new_populations = species.calculate_the_number_of_new_populations(
+                                            landscape, new_populations, 
+                                            populations, simulation_args, 
+                                            species_model, land_neighbours)
+
+            # Stop if the populations have died out or stopped changing.
+            if convergence_monitor is not None and \
+                    convergence_monitor.check(i, populations, 
+                                            new_populations):
+                break
+
+            # Switch the old population densities with the new population 
+            # densities for the next iteration of the simulation.
+            populations, new_populations = new_populations, populations
+            number_of_hares, number_of_pumas = populations[0], populations[1]
+
+        # If the simulation stopped early, display why and, if asked to, fill
+        # in the averages for the output time steps which were not run.
+        if convergence_monitor is not None and \
+                convergence_monitor.reason is not None:
+            convergence_monitor.display_stop(total_times)
+            if simulation_args['extrapolate']:
+                convergence_monitor.extrapolate_averages(simulation_args, 
+                    total_times, averages_writer, 
+                    species.calculate_averages(new_populations, 
+                                        number_land_only_squares,
+                                        simulation_args['reproducible']))
+            convergence_monitor.record_stop(total_times, averages_writer)
+    finally:
+        # Remove the shared memory segment first, as it outlives the process
+        # if it is not removed, then write out the averages still held in
+        # memory and finish the animation.
+        if state_publisher is not None:
+            state_publisher.close()
+        if averages_writer is not None:
+            averages_writer.close()
+        if animation_writer is not None:
+            animation_writer.close()
+
+    return completed
 
 if __name__ == "__main__":
     sim()
@@ -0,0 +1,369 @@
+from argparse import ArgumentParser, ArgumentTypeError
+
+# This module must not import numpy or simulation_functions, so that the
+# command-line arguments can be parsed, and help shown, without paying for
+# the import of numpy.
+
+def parse_region(text):
+    """
+    Converts a region given on the command line as X,Y,WIDTH,HEIGHT into a
+    tuple of integers.
+
+    :param text: text
+    :type text: str
+    :return: x, y, width and height of the region
+    :rtype: tuple
+    """
+    values = text.split(",")
+    if len(values) != 4:
+        raise ArgumentTypeError("expected X,Y,WIDTH,HEIGHT")
+    x, y, width, height = [int(value) for value in values]
+    if x < 0 or y < 0 or width < 1 or height < 1:
+        raise ArgumentTypeError("region must have a non-negative position and a positive size")
+
+    return x, y, width, height
+
+def check_regions(regions, width, height):
+    """
+    Checks that every region overlaps the landscape, so that a region which
+    does not is rejected before the simulation starts rather than when the
+    first map files are written.
+
+    :param regions: regions, each the result of parse_region
+    :type regions: list of type tuple
+    :param width: width of the landscape
+    :type width: int
+    :param height: height of the landscape
+    :type height: int
+    """
+    for x, y, region_width, region_height in regions:
+        if x >= width or y >= height:
+            raise ValueError("Region {} lies outside the landscape, which is "
+                            "{} by {}".format((x, y, region_width,
+                                            region_height), width, height))
+
+# The options which only the in-memory engine supports, given as their keys
+# in the simulation arguments, their flags and their values when they are
+# not given.
+IN_MEMORY_ONLY_OPTIONS = (
+    ('regions', "--region", []),
+    ('downsample', "--downsample", 1),
+    ('steady_state_tolerance', "--steady-state-tolerance", 0.0),
+    ('stop_on_extinction', "--stop-on-extinction", False),
+    ('animation_file', "--animation-file", None),
+    ('shared_memory', "--shared-memory", None),
+    ('species_file', "--species-file", None),
+)
+
+def check_engine_options(simulation_args):
+    """
+    Checks that the engine given by the simulation arguments supports all
+    of the other options given, so that an option which it does not support
+    is rejected before the simulation starts.
+
+    :param simulation_args: simulation_args
+    :type simulation_args: dict
+    """
+    if simulation_args['engine'] == "memory":
+        return
+
+    for name, flag, default in IN_MEMORY_ONLY_OPTIONS:
+        if simulation_args[name] != default:
+            raise ValueError("The {} engine does not support {}".format(
+                simulation_args['engine'], flag))
+
+def parse_positive_integer(text):
+    """
+    Converts a number given on the command line into an integer of at least
+    1.
+
+    :param text: text
+    :type text: str
+    :return: number
+    :rtype: int
+    """
+    number = int(text)
+    if number < 1:
+        raise ArgumentTypeError("must be at least 1")
+
+    return number
+
+def parse_rate(text):
+    """
+    Converts a rate given on the command line into a number or, if it is not
+    a number, leaves it as the name of a .npy raster file holding a rate for
+    each square of the landscape.
+
+    :param text: text
+    :type text: str
+    :return: rate or name of raster file
+    :rtype: float or str
+    """
+    try:
+        return float(text)
+    except ValueError:
+        if not text.endswith(".npy"):
+            raise ArgumentTypeError("expected a number or a .npy file")
+        return text
+
+def parse_tiles(text):
+    """
+    Converts a number of tiles given on the command line as ROWS,COLUMNS
+    into a tuple of integers.
+
+    :param text: text
+    :type text: str
+    :return: number of rows and columns of tiles
+    :rtype: tuple
+    """
+    values = text.split(",")
+    if len(values) != 2:
+        raise ArgumentTypeError("expected ROWS,COLUMNS")
+    rows, columns = [int(value) for value in values]
+    if rows < 1 or columns < 1:
+        raise ArgumentTypeError("there must be at least one row and column of tiles")
+
+    return rows, columns
+
+def parse_address(text):
+    """
+    Converts an address given on the command line as HOST:PORT into a tuple
+    of the host and the port.
+
+    :param text: text
+    :type text: str
+    :return: host and port
+    :rtype: tuple
+    """
+    host, separator, port = text.rpartition(":")
+    if not separator or not port.isdigit():
+        raise ArgumentTypeError("expected HOST:PORT")
+
+    return host, int(port)
+
+# The names of the rates in the simulation arguments, each of which may be a
+# number or the name of a raster file.
+RATE_NAMES = ('birth_rate_hares', 'death_rate_hares', 'diffusion_rate_hares',
+            'birth_rate_pumas', 'death_rate_pumas', 'diffusion_rate_pumas')
+
+# The command-line arguments of the simulation, given as the flags and the
+# keyword arguments of ArgumentParser.add_argument for each argument.
+ARGUMENT_SCHEMA = (
+    (("-r", "--birth-hares"), {'type' : parse_rate, 'default' : 0.08,
+        'help' : "Birth rate of hares"}),
+    (("-a", "--death-hares"), {'type' : parse_rate, 'default' : 0.04,
+        'help' : "Rate at which pumas eat hares"}),
+    (("-k", "--diffusion-hares"), {'type' : parse_rate, 'default' : 0.2,
+        'help' : "Diffusion rate of hares"}),
+    (("-b", "--birth-pumas"), {'type' : parse_rate, 'default' : 0.02,
+        'help' : "Birth rate of pumas"}),
+    (("-m", "--death-pumas"), {'type' : parse_rate, 'default' : 0.06,
+        'help' : "Rate at which pumas starve"}),
+    (("-l", "--diffusion-pumas"), {'type' : parse_rate, 'default' : 0.2,
+        'help' : "Diffusion rate of pumas"}),
+    (("-dt", "--delta-t"), {'type' : float, 'default' : 0.4,
+        'help' : "Time step size"}),
+    (("-t", "--time_step"), {'type' : int, 'default' : 10,
+        'help' : "Number of time steps at which to output files"}),
+    (("-d", "--duration"), {'type' : int, 'default' : 500,
+        'help' : "Time to run the simulation (in timesteps)"}),
+    (("-f", "--landscape-file"), {'type' : str, 'required' : True,
+        'help' : "Input landscape file"}),
+    (("-hs", "--hare-seed"), {'type' : int, 'default' : 1,
+        'help' : "Random seed for initialising hare densities"}),
+    (("-ps", "--puma-seed"), {'type' : int, 'default' : 1,
+        'help' : "Random seed for initialising puma densities"}),
+    (("-af", "--averages-format"), {'type' : str, 'default' : "csv",
+        'choices' : ("csv", "npy"),
+        'help' : "Format of the averages output: the averages.csv file or "
+            "the columnar binary averages directory"}),
+    (("-ab", "--averages-buffer"), {'type' : int, 'default' : 100,
+        'help' : "Number of rows of averages to hold in memory before "
+            "writing them out"}),
+    (("-rg", "--region"), {'type' : parse_region, 'action' : "append",
+        'default' : [], 'metavar' : "X,Y,WIDTH,HEIGHT",
+        'help' : "Write map files of only this rectangle of the landscape, "
+            "given in squares from the top left; may be given more than "
+            "once"}),
+    (("-ds", "--downsample"), {'type' : parse_positive_integer,
+        'default' : 1,
+        'help' : "Write map files of the landscape reduced by this factor "
+            "in each direction"}),
+    (("-dm", "--downsample-mode"), {'type' : str, 'default' : "stride",
+        'choices' : ("stride", "mean"),
+        'help' : "Downsample by keeping every DOWNSAMPLE-th square or by "
+            "averaging blocks of squares"}),
+    (("-st", "--steady-state-tolerance"), {'type' : float, 'default' : 0.0,
+        'help' : "Stop once the largest change in density in any square "
+            "stays below this for STEADY_STATE_WINDOW time steps (0 to "
+            "never stop at a steady state)"}),
+    (("-sw", "--steady-state-window"), {'type' : int, 'default' : 10,
+        'help' : "Number of time steps in a row the change in density must "
+            "stay below STEADY_STATE_TOLERANCE"}),
+    (("-se", "--stop-on-extinction"), {'action' : "store_true",
+        'help' : "Stop once hares and pumas have died out everywhere"}),
+    (("-ex", "--extrapolate"), {'action' : "store_true",
+        'help' : "After stopping early, write the averages for the "
+            "remaining output time steps as they were when it stopped"}),
+    (("-e", "--engine"), {'type' : str, 'default' : "memory",
+        'choices' : ("memory", "out-of-core", "distributed"),
+        'help' : "Hold the landscape and populations in memory, in "
+            "memory-mapped files in STATE_DIRECTORY for landscapes too "
+            "large for memory, or spread over worker processes"}),
+    (("-br", "--band-rows"), {'type' : int, 'default' : 256,
+        'help' : "Number of rows the out-of-core engine calculates at "
+            "once"}),
+    (("-sd", "--state-directory"), {'type' : str, 'default' : "state",
+        'help' : "Directory holding the files of the out-of-core "
+            "engine"}),
+    (("-an", "--animation-file"), {'type' : str, 'default' : None,
+        'help' : "Write the maps to this animated .gif or .png file instead "
+            "of to map files"}),
+    (("-ad", "--animation-delay"), {'type' : int, 'default' : 100,
+        'help' : "Time each frame of the animation is shown for (in "
+            "milliseconds)"}),
+    (("-sm", "--shared-memory"), {'type' : str, 'default' : None,
+        'help' : "Publish the state of the simulation to the shared memory "
+            "segment with this name"}),
+    (("-pi", "--publish-interval"), {'type' : parse_positive_integer,
+        'default' : None,
+        'help' : "Number of time steps at which to publish the state to "
+            "shared memory (by default, the number of time steps at which "
+            "to output files)"}),
+    (("-tl", "--tiles"), {'type' : parse_tiles, 'default' : (2, 2),
+        'metavar' : "ROWS,COLUMNS",
+        'help' : "Number of rows and columns of tiles the distributed "
+            "engine splits the landscape into, one worker per tile"}),
+    (("-ca", "--coordinator-address"), {'type' : parse_address,
+        'default' : ("127.0.0.1", 0), 'metavar' : "HOST:PORT",
+        'help' : "Address the distributed engine waits for workers on (port "
+            "0 for any free port)"}),
+    (("-xw", "--external-workers"), {'action' : "store_true",
+        'help' : "Wait for workers started with distributed.py, on this "
+            "or other hosts, instead of starting them"}),
+    (("-sp", "--species-file"), {'type' : str, 'default' : None,
+        'help' : "JSON file describing the species and how they interact, "
+            "instead of the rates of hares and pumas"}),
+    (("-dr", "--dry-run"), {'action' : "store_true",
+        'help' : "Show the memory the simulation would take, and how much "
+            "each array takes, without running it"}),
+    (("-rp", "--reproducible"), {'action' : "store_true",
+        'help' : "Add up the averages in a fixed order, so they are the same "
+            "to the last bit with every engine, band size and number of "
+            "tiles"}),
+)
+
+def get_command_line_arguments():
+    """
+    Get command line arguments required to perform simulation.
+
+    :return: parameters
+    :rtype: ArgumentParser
+    """
+    # Create an ArgumentParser object to parse command-line
+    # strings into Python objects.
+    parameters=ArgumentParser()
+
+    # Define how each of the command-line arguments should be parsed
+    # and added to the parameters object.
+    for flags, options in ARGUMENT_SCHEMA:
+        parameters.add_argument(*flags, **options)
+
+    return parameters
+
+def create_args_dictionary(command_line_args, argv=None):
+    """
+    Creates a dictionary relating the names of the command-line
+    arguments with variables containing their values.
+
+    :param command_line_args: command_line_args
+    :type command_line_args: ArgumentParser
+    :param argv: argument strings to parse instead of those given on the
+    command line
+    :type argv: list of type str
+    :return: dictionary of command-line arguments and their values
+    :rtype: dict
+    """
+    # Convert argument strings to objects and assign them as attributes
+    # of the Namespace object args. If argv is None the arguments given on
+    # the command line are used.
+    args = command_line_args.parse_args(argv)
+
+    # Assign each of the attributes of the Namespace object args,
+    # to a separate variable
+    birth_rate_hares = args.birth_hares
+    death_rate_hares = args.death_hares
+    diffusion_rate_hares = args.diffusion_hares
+    birth_rate_pumas = args.birth_pumas
+    death_rate_pumas = args.death_pumas
+    diffusion_rate_pumas = args.diffusion_pumas
+    time_step_size = args.delta_t
+    time_step_number = args.time_step
+    duration = args.duration
+    landscape_file = args.landscape_file
+    hseed = args.hare_seed
+    pseed = args.puma_seed
+    averages_format = args.averages_format
+    averages_buffer_rows = args.averages_buffer
+    regions = args.region
+    downsample = args.downsample
+    downsample_mode = args.downsample_mode
+    steady_state_tolerance = args.steady_state_tolerance
+    steady_state_window = args.steady_state_window
+    stop_on_extinction = args.stop_on_extinction
+    extrapolate = args.extrapolate
+    engine = args.engine
+    band_rows = args.band_rows
+    state_directory = args.state_directory
+    animation_file = args.animation_file
+    animation_delay = args.animation_delay
+    shared_memory = args.shared_memory
+    # Unless asked to publish more or less often, publish the state when
+    # the averages are calculated for the output, so publishing does not
+    # add to the time each time step takes.
+    publish_interval = args.publish_interval
+    if publish_interval is None:
+        publish_interval = time_step_number
+    tiles = args.tiles
+    coordinator_address = args.coordinator_address
+    external_workers = args.external_workers
+    species_file = args.species_file
+    dry_run = args.dry_run
+    reproducible = args.reproducible
+
+    return {
+        'birth_rate_hares'  : birth_rate_hares,
+        'death_rate_hares'  : death_rate_hares,
+        'diffusion_rate_hares'  : diffusion_rate_hares,
+        'birth_rate_pumas'  : birth_rate_pumas,
+        'death_rate_pumas'  : death_rate_pumas,
+        'diffusion_rate_pumas'  : diffusion_rate_pumas,
+        'time_step_size' : time_step_size,
+        'time_step_number'  : time_step_number,
+        'duration'  : duration,
+        'landscape_file' : landscape_file,
+        'hseed' : hseed,
+        'pseed' : pseed,
+        'averages_format' : averages_format,
+        'averages_buffer_rows' : averages_buffer_rows,
+        'regions' : regions,
+        'downsample' : downsample,
+        'downsample_mode' : downsample_mode,
+        'steady_state_tolerance' : steady_state_tolerance,
+        'steady_state_window' : steady_state_window,
+        'stop_on_extinction' : stop_on_extinction,
+        'extrapolate' : extrapolate,
+        'engine' : engine,
+        'band_rows' : band_rows,
+        'state_directory' : state_directory,
+        'animation_file' : animation_file,
+        'animation_delay' : animation_delay,
+        'shared_memory' : shared_memory,
+        'publish_interval' : publish_interval,
+        'tiles' : tiles,
+        'coordinator_address' : coordinator_address,
+        'external_workers' : external_workers,
+        'species_file' : species_file,
+        'dry_run' : dry_run,
+        'reproducible' : reproducible,
+    }
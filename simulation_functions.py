@@ -1,91 +1,9 @@
-from argparse import ArgumentParser
 import numpy as np
 import random
-import time
-
-def get_command_line_arguments():
-    """
-    Get command line arguments required to perform simulation.
-    
-    :return: parameters 
-    :rtype: ArgumentParser
-    """
-    # Create an ArgumentParser object to parse command-line 
-    # strings into Python objects.
-    parameters=ArgumentParser()
-
-    # Define how each of the command-line arguments should be parsed
-    # and added to the parameters object.
-    parameters.add_argument("-r","--birth-hares",type=float,default=0.08,
-                        help="Birth rate of hares")
-    parameters.add_argument("-a","--death-hares",type=float,default=0.04,
-                        help="Rate at which pumas eat hares")
-    parameters.add_argument("-k","--diffusion-hares",type=float,default=0.2,
-                        help="Diffusion rate of hares")
-    parameters.add_argument("-b","--birth-pumas",type=float,default=0.02,
-                        help="Birth rate of pumas")
-    parameters.add_argument("-m","--death-pumas",type=float,default=0.06,
-                        help="Rate at which pumas starve")
-    parameters.add_argument("-l","--diffusion-pumas",type=float,default=0.2,
-                        help="Diffusion rate of pumas")
-    parameters.add_argument("-dt","--delta-t",type=float,default=0.4,
-                        help="Time step size")
-    parameters.add_argument("-t","--time_step",type=int,default=10,
-                        help="Number of time steps at which to output files")
-    parameters.add_argument("-d","--duration",type=int,default=500,
-                        help="Time to run the simulation (in timesteps)")
-    parameters.add_argument("-f","--landscape-file",type=str,required=True,
-                        help="Input landscape file")
-    parameters.add_argument("-hs","--hare-seed",type=int,default=1,
-                        help="Random seed for initialising hare densities")
-    parameters.add_argument("-ps","--puma-seed",type=int,default=1,
-                        help="Random seed for initialising puma densities")
-
-    return parameters
-
-def create_args_dictionary(command_line_args):
-    """
-    Creates a dictionary relating the names of the command-line
-    arguments with variables containing their values.
-
-    :param command_line_args: command_line_args
-    :type command_line_args: ArgumentParser
-    :return: dictionary of command-line arguments and their values
-    :rtype: dict
-    """
-    # Convert argument strings to objects and assign them as attributes 
-    # of the Namespace object args.
-    args = command_line_args.parse_args()
-
-    # Assign each of the attributes of the Namespace object args,
-    # to a separate variable 
-    birth_rate_hares = args.birth_hares
-    death_rate_hares = args.death_hares
-    diffusion_rate_hares = args.diffusion_hares
-    birth_rate_pumas = args.birth_pumas
-    death_rate_pumas = args.death_pumas
-    diffusion_rate_pumas = args.diffusion_pumas
-    time_step_size = args.delta_t
-    time_step_number = args.time_step
-    duration = args.duration
-    landscape_file = args.landscape_file
-    hseed = args.hare_seed
-    pseed = args.puma_seed
-
-    return {
-        'birth_rate_hares'  : birth_rate_hares,
-        'death_rate_hares'  : death_rate_hares,
-        'diffusion_rate_hares'  : diffusion_rate_hares,
-        'birth_rate_pumas'  : birth_rate_pumas,
-        'death_rate_pumas'  : death_rate_pumas,
-        'diffusion_rate_pumas'  : diffusion_rate_pumas,
-        'time_step_size' : time_step_size,
-        'time_step_number'  : time_step_number,
-        'duration'  : duration,
-        'landscape_file' : landscape_file,
-        'hseed' : hseed,
-        'pseed' : pseed,
-    }
+# The command-line arguments are defined in simulation_arguments, which does
+# not import numpy, and are made available here as well.
+from simulation_arguments import get_command_line_arguments, \
+    create_args_dictionary, RATE_NAMES
 
 def create_simulation_landscape(simulation_args):
     """
@@ -254,19 +172,38 @@ def create_land_neighbours_grid(grid_dimensions, landscape):
 
     return land_neighbours
 
-def calculate_number_hares(grid_dimensions, landscape, simulation_args):
+def prepare_landscape(simulation_args):
     """
-    Creates a grid to represent the population density of hares within
-    the simulation landscape, assigning a number of hares to each square of
-    the landscape with a value between 0 and 5.0.
+    Reads in the landscape file and pre-calculates everything about the
+    landscape which does not change while the simulation runs, so that it
+    can be reused by successive simulations of the same landscape.
+
+    :param simulation_args: simulation_args
+    :type simulation_args: dict
+    :return: grid_dimensions, landscape, number_land_only_squares and
+    land_neighbours
+    :rtype: tuple
+    """
+    grid_dimensions, landscape = create_simulation_landscape(simulation_args)
+    number_land_only_squares = calculate_number_land_only_squares(landscape)
+    land_neighbours = create_land_neighbours_grid(grid_dimensions, landscape)
+
+    return (grid_dimensions, landscape, number_land_only_squares, 
+        land_neighbours)
+
+def calculate_population(grid_dimensions, landscape, seed):
+    """
+    Creates a grid to represent the population density of a species within
+    the simulation landscape, assigning a number of animals to each square
+    of the landscape with a value between 0 and 5.0.
 
     :param grid_dimensions: grid_dimensions
     :type grid_dimensions: list of type int
     :param landscape: landscape
     :type landscape: ndarray
-    :param simulation_args: simulation_args
-    :type simulation_args: dict
-    :return: grid representing the number of hares in the landscape
+    :param seed: random seed, or 0 for no animals
+    :type seed: int
+    :return: grid representing the number of animals in the landscape
     :rtype: ndarray
     """
     # Get the individual grid dimensions required.
@@ -274,131 +211,78 @@ def calculate_number_hares(grid_dimensions, landscape, simulation_args):
     height = get_height(grid_dimensions)
 
     # Create a copy of the simulation landscape to represent
-    # the hare population density.
-    number_of_hares = landscape.astype(float).copy()
+    # the population density.
+    population = landscape.astype(float).copy()
 
-    # Use the hseed simulation argument to produce a random number which will
-    # represent the initial number of hares in the landscape.
-    random.seed(simulation_args['hseed'])
+    # Use the seed to produce a random number which will represent the 
+    # initial number of animals in the landscape.
+    random.seed(seed)
 
-    # Loop through the grid representing the hare population density.
+    # Loop through the grid representing the population density.
     for x in range(1, height + 1):
         for y in range(1, width + 1):
-            # Check if the value for initial number of hares in the landscape
-            # is equal to zero.
-            if simulation_args['hseed'] == 0:
-                # If the initial number of hares in the landscape is zero,
-                # then set the number of hares in the current square to zero.
-                number_of_hares[x, y] = 0
+            # Check if the value for initial number of animals in the 
+            # landscape is equal to zero.
+            if seed == 0:
+                # If the initial number of animals in the landscape is zero,
+                # then set the number of animals in the current square to 
+                # zero.
+                population[x, y] = 0
             else:
-                # If the value for initial number of hares in the landscape is
-                # non-zero then check that the current square of the landscape
+                # If the value for initial number of animals in the landscape
+                # is non-zero then check that the current square of the landscape
                 # is also non-zero and hence a land square rather than a water
                 # square.
                 if landscape[x, y]:
                     # If the current square of the landscape is non-zero and 
-                    # hence a land square, then set the number of hares in the
-                    # current landscape square to a random number between 0
+                    # hence a land square, then set the number of animals in
+                    # the current landscape square to a random number between 0
                     # and 5.0.
-                    number_of_hares[x, y] = random.uniform(0,5.0)
+                    population[x, y] = random.uniform(0,5.0)
                 else:
                     # If the current square of the landscape is zero and hence
-                    # a water square then set the number of hares in the 
-                    # current landscape square to zero, since hares and pumas
-                    # in the simulation are assumed to be unable to swim.
-                    number_of_hares[x, y] = 0
+                    # a water square then set the number of animals in the 
+                    # current landscape square to zero, since animals in the
+                    # simulation are assumed to be unable to swim.
+                    population[x, y] = 0
 
-    return number_of_hares
+    return population
 
-def calculate_number_pumas(grid_dimensions, landscape, simulation_args):
+def calculate_number_hares(grid_dimensions, landscape, simulation_args):
     """
-    Creates a grid to represent the population density of pumas within
-    the simulation landscape, assigning a number of pumas to each square of
+    Creates a grid to represent the population density of hares within
+    the simulation landscape, assigning a number of hares to each square of
     the landscape with a value between 0 and 5.0.
-    
+
     :param grid_dimensions: grid_dimensions
     :type grid_dimensions: list of type int
     :param landscape: landscape
     :type landscape: ndarray
     :param simulation_args: simulation_args
     :type simulation_args: dict
-    :return grid representing the number of pumas in the landscape
+    :return: grid representing the number of hares in the landscape
     :rtype: ndarray
     """
-    # Get the individual grid dimensions required.
-    width = get_width(grid_dimensions)
-    height = get_height(grid_dimensions)
-
-    # Create a copy of the simulation landscape to represent 
-    # the puma population density.
-    number_of_pumas = landscape.astype(float).copy()
+    return calculate_population(grid_dimensions, landscape, 
+                            simulation_args['hseed'])
 
-    # Use the hseed simulation argument to produce a random number which will
-    # represent the initial number of pumas in the landscape.
-    random.seed(simulation_args['pseed'])
-
-    # Loop through the grid representing the hare population density.
-    for x in range(1, height + 1):
-        for y in range(1, width + 1):
-            # Check if the value for initial number of pumas in the landscape
-            # is equal to zero.
-            if simulation_args['pseed'] == 0:
-                # If the initial number of pumas in the landscape is zero,
-                # then set the number of pumas in the current square to zero.
-                number_of_pumas[x, y] = 0
-            else:
-                # If the value for initial number of pumas in the landscape is
-                # non-zero then check that the current square of the landscape
-                # is also non-zero and hence a land square rather than a water
-                # square.
-                if landscape[x,y]:
-                    # If the current square of the landscape is non-zero and 
-                    # hence a land square, then set the number of pumas in the
-                    # current landscape square to a random number between 0
-                    # and 5.0.
-                    number_of_pumas[x, y] = random.uniform(0,5.0)
-                else:
-                    # If the current square of the landscape is zero and hence
-                    # a water square then set the number of pumas in the 
-                    # current landscape square to zero, since hares and pumas
-                    # in the simulation are assumed to be unable to swim.
-                    number_of_pumas[x, y] = 0
-    
-    return number_of_pumas
-
-def create_grid_copies(grid_dimensions, number_of_hares, number_of_pumas):
+def calculate_number_pumas(grid_dimensions, landscape, simulation_args):
     """
-    Creates copies of the landscape grids representing the population 
-    densities of hares and pumas for use in successive iterations of the
-    simulation.
+    Creates a grid to represent the population density of pumas within
+    the simulation landscape, assigning a number of pumas to each square of
+    the landscape with a value between 0 and 5.0.
     
     :param grid_dimensions: grid_dimensions
     :type grid_dimensions: list of type int
-    :param number_of_hares: number_of_hares
-    :type number_of_hares: ndarray
-    :param number_of_pumas: number_of_pumas
-    :type number_of_pumas: ndarrays
-    :return: a copy of the population densities of hares and columns and grids
-    to represent the columns which hold hares and pumas.
-    :rtype: tuple
+    :param landscape: landscape
+    :type landscape: ndarray
+    :param simulation_args: simulation_args
+    :type simulation_args: dict
+    :return grid representing the number of pumas in the landscape
+    :rtype: ndarray
     """
-
-    # Get the individual grid dimensions required.
-    width = get_width(grid_dimensions)
-    height = get_height(grid_dimensions)
-
-    # Create copies of the grids representing hare and puma population 
-    # densities, for use in calculating the new populations.
-    number_of_new_hares = number_of_hares.copy()
-    number_of_new_pumas = number_of_pumas.copy()
-
-    # Create grids of zeroes with identical dimensions to the landscape, to 
-    # represent the columns which hold hares and pumas.
-    hare_columns = np.zeros((height, width), int)
-    puma_columns = np.zeros((height, width), int)
-
-    return (number_of_new_hares, number_of_new_pumas, 
-        hare_columns, puma_columns)
+    return calculate_population(grid_dimensions, landscape, 
+                            simulation_args['pseed'])
 
 def calculate_averages(number_of_hares, number_of_pumas, 
                     number_land_only_squares):
@@ -432,35 +316,6 @@ def calculate_averages(number_of_hares, number_of_pumas,
 
     return (average_number_of_hares, average_number_of_pumas)
 
-def initialise_averages_file(number_of_hares, number_of_pumas, 
-                            number_land_only_squares):
-    """
-    Print the average number of hares and pumas at the initial timestep and
-    store them in the averages.csv file, initialising it.
-    
-    :param number_of_hares: number_of_hares
-    :type number_of_hares: ndarray
-    :param number_of_pumas: number_of_pumas
-    :type number_of_pumas: ndarray
-    :param number_land_only_squares: number_land_only_squares
-    :type number_land_only_squares: int
-    """
-    average_number_of_hares, average_number_of_pumas = \
-        calculate_averages(number_of_hares, 
-                        number_of_pumas, 
-                        number_land_only_squares)
-
-    # Print the first line of averages for the hares and pumas at the initial
-    # time step.
-    print("Averages. Timestep: {} Time (s): {} Hares: {} Pumas: {}"\
-        .format(0,0, average_number_of_hares, average_number_of_pumas))
-    
-    # Write a file header to the averages.csv file, representing the data 
-    # which will be written to it.
-    with open("averages.csv", "w") as file_object:
-        file_header = "Timestep,Time,Hares,Pumas\n"
-        file_object.write(file_header)
-
 def calculate_total_number_time_steps(simulation_args):
     """
     Calculates the total number of time steps.
@@ -490,27 +345,6 @@ def display_averages(i, simulation_args, average_number_of_hares,
             .format(i, i*simulation_args['time_step_size'], 
                 average_number_of_hares, average_number_of_pumas))
 
-def append_averages_to_file(i, simulation_args, average_number_of_hares, 
-                        average_number_of_pumas):
-    """
-    Appends the average number of hares and pumas and the corresponding
-    timestep and time in seconds to the averages.csv file.
-    
-    :param i: i
-    :type i: int
-    :param simulation_args: simulation_args
-    :type simulation_args: dict
-    :param average_number_of_hares: average_number_of_hares
-    :type average_number_of_hares:  int
-    :param average_number_of_pumas: average_number_of_pumas
-    :type average_number_of_pumas:  int
-    """
-    with open("averages.csv".format(i),"a") as file_object:
-            file_object.write("{},{},{},{}\n".format(i, 
-                                        i*simulation_args['time_step_size'], 
-                                        average_number_of_hares, 
-                                        average_number_of_pumas))
-
 def generate_hare_and_puma_columns(width, height, max_number_hares, 
             number_of_hares, max_number_pumas, number_of_pumas, landscape, 
             hare_columns, puma_columns):
@@ -620,41 +454,242 @@ def write_columns_to_map_files(i, width, height, landscape, hare_columns,
                         # hare and puma columns values.
                         file_object.write("{} {} {}\n".format(0, 0, 255))
 
-def swap_array_for_next_iteration(number_of_hares, number_of_pumas, 
-            number_of_new_hares, number_of_new_pumas):
+def calculate_region_columns(landscape, max_number_hares, number_of_hares, 
+            max_number_pumas, number_of_pumas, rows, columns):
     """
-    Switches the old population densities of hares and pumas with the new 
-    population densities of hares and pumas, in preparation for calculating
-    the new population at the next timestep of the simulation.
-    
+    Generates hare and puma column values for the squares of the landscape 
+    selected by the given row and column slices, in the same way as 
+    generate_hare_and_puma_columns but only for the selected squares.
+
+    :param landscape: landscape
+    :type landscape: ndarray
+    :param max_number_hares: max_number_hares
+    :type max_number_hares: int
     :param number_of_hares: number_of_hares
     :type number_of_hares: ndarray
+    :param max_number_pumas: max_number_pumas
+    :type max_number_pumas:  int
     :param number_of_pumas: number_of_pumas
     :type number_of_pumas: ndarray
-    :param number_of_new_hares: number_of_new_hares
-    :type number_of_new_hares: ndarray
-    :param number_of_new_pumas: number_of_new_pumas
-    :type number_of_new_pumas: ndarray
+    :param rows: rows of the landscape, including the halo, to select
+    :type rows: slice
+    :param columns: columns of the landscape, including the halo, to select
+    :type columns: slice
+    :return: land, hare_columns and puma_columns for the selected squares
+    :rtype: tuple
+    """
+    land = landscape[rows, columns] != 0
+
+    # Scale the population densities to between 0 and 255, leaving them as
+    # zero if the maximum is zero or the square is a water square.
+    hare_columns = np.zeros(land.shape, int)
+    puma_columns = np.zeros(land.shape, int)
+    if max_number_hares != 0:
+        hare_columns[land] = (number_of_hares[rows, columns][land] / 
+                            max_number_hares) * 255
+    if max_number_pumas != 0:
+        puma_columns[land] = (number_of_pumas[rows, columns][land] / 
+                            max_number_pumas) * 255
+
+    return land, hare_columns, puma_columns
+
+def calculate_block_mean_columns(landscape, max_number_hares, 
+            number_of_hares, max_number_pumas, number_of_pumas, 
+            grid_dimensions, factor):
     """
-    tmp = number_of_hares
-    number_of_hares = number_of_new_hares
-    number_of_new_hares = tmp
-    tmp = number_of_pumas
-    number_of_pumas = number_of_new_pumas
-    number_of_new_pumas = tmp
+    Generates hare and puma column values for a reduced copy of the 
+    landscape, in which each square stands for a block of factor by factor
+    squares and holds the average density of the land squares in the block.
+    A block with no land squares is a water square.
 
-def calculate_the_number_of_new_hares_and_pumas(width, height, landscape, 
+    :param landscape: landscape
+    :type landscape: ndarray
+    :param max_number_hares: max_number_hares
+    :type max_number_hares: int
+    :param number_of_hares: number_of_hares
+    :type number_of_hares: ndarray
+    :param max_number_pumas: max_number_pumas
+    :type max_number_pumas:  int
+    :param number_of_pumas: number_of_pumas
+    :type number_of_pumas: ndarray
+    :param grid_dimensions: grid_dimensions
+    :type grid_dimensions: list of type int
+    :param factor: factor
+    :type factor: int
+    :return: land, hare_columns and puma_columns for the reduced landscape
+    :rtype: tuple
+    """
+    width = get_width(grid_dimensions)
+    height = get_height(grid_dimensions)
+
+    # Blocks at the right and bottom edges may be smaller than the others,
+    # so the landscape is padded with water to a whole number of blocks.
+    reduced_height = -(-height // factor)
+    reduced_width = -(-width // factor)
+    shape = (reduced_height, factor, reduced_width, factor)
+
+    def block_sums(grid):
+        padded = np.zeros((reduced_height * factor, reduced_width * factor))
+        padded[:height, :width] = grid[1:height + 1, 1:width + 1]
+        return padded.reshape(shape).sum(axis=(1, 3))
+
+    land_counts = block_sums(landscape != 0)
+    land = land_counts != 0
+    hare_columns = np.zeros(land.shape, int)
+    puma_columns = np.zeros(land.shape, int)
+    if max_number_hares != 0:
+        hare_columns[land] = (block_sums(number_of_hares)[land] / 
+                            land_counts[land] / max_number_hares) * 255
+    if max_number_pumas != 0:
+        puma_columns[land] = (block_sums(number_of_pumas)[land] / 
+                            land_counts[land] / max_number_pumas) * 255
+
+    return land, hare_columns, puma_columns
+
+def write_view_to_map_file(file_name, land, hare_columns, puma_columns):
+    """
+    Writes hare and puma column values to a map file in the same format as
+    write_columns_to_map_files, formatting all of the squares at once.
+
+    :param file_name: file_name
+    :type file_name: str
+    :param land: land
+    :type land: ndarray
+    :param hare_columns: hare_columns
+    :type hare_columns: ndarray
+    :param puma_columns: puma_columns
+    :type puma_columns: ndarray
+    """
+    height, width = land.shape
+
+    # Land squares hold their hare and puma columns values and 0, water 
+    # squares hold 0, 0 and 255.
+    pixels = np.stack((np.where(land, hare_columns, 0), 
+                    np.where(land, puma_columns, 0), 
+                    np.where(land, 0, 255)), axis=-1)
+
+    with open(file_name, "w") as file_object:
+        file_object.write("P3\n{} {}\n{}\n".format(width, height, 255))
+        file_object.write(("{} {} {}\n" * (height * width))
+                        .format(*pixels.ravel().tolist()))
+
+def write_map_views(i, simulation_args, grid_dimensions, landscape, 
+            max_number_hares, number_of_hares, max_number_pumas, 
+            number_of_pumas):
+    """
+    Writes map files of only the regions of the landscape and the reduced 
+    landscape given by the simulation arguments, so that the time taken 
+    depends on the size of what is written rather than on the size of the 
+    landscape. Region k is written to map_<NNNN>_region_<k>.ppm and the 
+    reduced landscape to map_<NNNN>_reduced.ppm.
+
+    :param i: i
+    :type i: int
+    :param simulation_args: simulation_args
+    :type simulation_args: dict
+    :param grid_dimensions: grid_dimensions
+    :type grid_dimensions: list of type int
+    :param landscape: landscape
+    :type landscape: ndarray
+    :param max_number_hares: max_number_hares
+    :type max_number_hares: int
+    :param number_of_hares: number_of_hares
+    :type number_of_hares: ndarray
+    :param max_number_pumas: max_number_pumas
+    :type max_number_pumas:  int
+    :param number_of_pumas: number_of_pumas
+    :type number_of_pumas: ndarray
+    """
+    width = get_width(grid_dimensions)
+    height = get_height(grid_dimensions)
+
+    for k, (x, y, region_width, region_height) in \
+            enumerate(simulation_args['regions']):
+        # Clip the region to the landscape and skip the halo.
+        rows = slice(1 + min(y, height), 1 + min(y + region_height, height))
+        columns = slice(1 + min(x, width), 1 + min(x + region_width, width))
+        if rows.start == rows.stop or columns.start == columns.stop:
+            raise ValueError("Region {} lies outside the landscape"
+                .format((x, y, region_width, region_height)))
+        write_view_to_map_file("map_{:04d}_region_{}.ppm".format(i, k), 
+            *calculate_region_columns(landscape, max_number_hares, 
+                                    number_of_hares, max_number_pumas, 
+                                    number_of_pumas, rows, columns))
+
+    factor = simulation_args['downsample']
+    if factor > 1:
+        if simulation_args['downsample_mode'] == "mean":
+            view = calculate_block_mean_columns(landscape, max_number_hares, 
+                                    number_of_hares, max_number_pumas, 
+                                    number_of_pumas, grid_dimensions, factor)
+        else:
+            view = calculate_region_columns(landscape, max_number_hares, 
+                                    number_of_hares, max_number_pumas, 
+                                    number_of_pumas, 
+                                    slice(1, height + 1, factor), 
+                                    slice(1, width + 1, factor))
+        write_view_to_map_file("map_{:04d}_reduced.ppm".format(i), *view)
+
+def load_rates(simulation_args, grid_dimensions):
+    """
+    Gets the birth, death and diffusion rates of the simulation, each of 
+    which is either a number or the name of a .npy raster file holding a rate
+    for each square of the landscape. Raster files are memory-mapped rather
+    than read in, and may or may not include the "halo" squares.
+
+    :param simulation_args: simulation_args
+    :type simulation_args: dict
+    :param grid_dimensions: grid_dimensions
+    :type grid_dimensions: list of type int
+    :return: dictionary of rate names and rates, each a number or a grid 
+    with the dimensions of the landscape without the halo
+    :rtype: dict
+    """
+    rates = {}
+    for name in RATE_NAMES:
+        rate = simulation_args[name]
+        if isinstance(rate, str):
+            rate = load_raster(rate, grid_dimensions)
+        rates[name] = rate
+
+    return rates
+
+def load_raster(file_name, grid_dimensions):
+    """
+    Memory-maps a .npy raster file holding a value for each square of the
+    landscape, which may or may not include the "halo" squares.
+
+    :param file_name: file_name
+    :type file_name: str
+    :param grid_dimensions: grid_dimensions
+    :type grid_dimensions: list of type int
+    :return: grid with the dimensions of the landscape without the halo
+    :rtype: ndarray
+    """
+    width = get_width(grid_dimensions)
+    height = get_height(grid_dimensions)
+
+    raster = np.load(file_name, mmap_mode="r")
+    if raster.shape == (height + 2, width + 2):
+        # Leave out the halo squares, without copying the raster.
+        raster = raster[1:-1, 1:-1]
+    elif raster.shape != (height, width):
+        raise ValueError("Raster {} has dimensions {} but the "
+            "landscape has dimensions {}".format(file_name, raster.shape, 
+            (height, width)))
+
+    return raster
+
+def calculate_the_number_of_new_hares_and_pumas_vectorised(landscape, 
             number_of_new_hares, number_of_hares, number_of_new_pumas, 
-            number_of_pumas, simulation_args, land_neighbours):
+            number_of_pumas, simulation_args, rates, land_neighbours):
     """
     Calculates the number of new hares and pumas using the numerical 
     approximations of the partial differential equations used to model the 
-    behaviour of pumas and hares within a landscape.
+    behaviour of pumas and hares within a landscape, for all of the squares
+    of the landscape at once, so that each rate may be a number or a grid 
+    holding a rate for each square.
     
-    :param width: width
-    :type width: int
-    :param height: height
-    :type height: int
     :param landscape: landscape
     :type landscape: ndarray
     :param number_of_new_hares: number_of_new_hares
@@ -667,65 +702,57 @@ def calculate_the_number_of_new_hares_and_pumas(width, height, landscape,
     :type number_of_pumas: ndarray
     :param simulation_args: simulation_args
     :type simulation_args: dict
+    :param rates: the result of load_rates
+    :type rates: dict
     :param land_neighbours: land_neighbours
     :type land_neighbours: ndarray
     :return: the number of new hares and pumas
     :rtype: tuple
     """
-    # Loop through the simulation landscape.
-    for x in range(1, height + 1):
-        for y in range(1, width + 1):
-            # Check that the current landscape square is non-zero, hence a
-            # land square and not a water square.
-            if landscape[x,y]:
-                # If the current landscape square is a land square, then
-                # calculate the new number of hares and pumas in the landscape, 
-                # using the numerical approximations of the partial 
-                # differential equations used to model the behaviour of pumas 
-                # and hares within a landscape.
-                number_of_new_hares[x, y] = (number_of_hares[x, y] + 
-                        simulation_args['time_step_size'] * 
-                        (simulation_args['birth_rate_hares'] * 
-                        number_of_hares[x, y]) - 
-                        (simulation_args['death_rate_hares'] * 
-                        number_of_hares[x, y] * 
-                        number_of_pumas[x, y]) + 
-                        simulation_args['diffusion_rate_hares'] *
-                        ((number_of_hares[x-1, y] +
-                        number_of_hares[x+1, y] + 
-                        number_of_hares[x, y-1] 
-                        + number_of_hares[x, y+1]) - 
-                        (land_neighbours[x, y] * 
-                        number_of_hares[x, y])))
-
-                # Check if the number of new hares calculated is less than 
-                # zero.
-                if number_of_new_hares[x, y] < 0:
-                    # If the number of new hares is less than zero then set
-                    # the number of new hares in the current landscape square
-                    # to zero.
-                    number_of_new_hares[x, y] = 0
-
-                number_of_new_pumas[x, y] = (number_of_pumas[x, y] + 
-                            simulation_args['time_step_size'] * 
-                            ((simulation_args['birth_rate_pumas'] * 
-                            number_of_hares[x, y] * number_of_pumas[x, y]) - 
-                            (simulation_args['death_rate_pumas'] * 
-                            number_of_pumas[x, y]) + 
-                            simulation_args['diffusion_rate_pumas'] * 
-                            ((number_of_pumas[x-1, y] 
-                            + number_of_pumas[x+1, y] + 
-                            number_of_pumas[x, y-1] 
-                            + number_of_pumas[x, y+1]) - 
-                            (land_neighbours[x, y] * 
-                            number_of_pumas[x,y]))))
-                
-                # Check if the number of new pumas calculated is less than 
-                # zero.
-                if number_of_new_pumas[x, y] < 0:
-                    # If the number of new pumas is less than zero then set
-                    # the number of new pumas in the current landscape square
-                    # to zero.
-                    number_of_new_pumas[x, y] = 0
+    # Select the squares of each grid which are not "halo" squares, and the 
+    # squares above, below, left and right of them.
+    hares = number_of_hares[1:-1, 1:-1]
+    pumas = number_of_pumas[1:-1, 1:-1]
+    neighbours = land_neighbours[1:-1, 1:-1]
+    land = landscape[1:-1, 1:-1] != 0
+    time_step_size = simulation_args['time_step_size']
+
+    # The terms are grouped exactly as in the loop over the squares, so that
+    # the results are identical.
+    new_hares = (hares + 
+            time_step_size * 
+            ((rates['birth_rate_hares'] * 
+            hares) - 
+            (rates['death_rate_hares'] * 
+            hares * 
+            pumas) + 
+            rates['diffusion_rate_hares'] *
+            ((number_of_hares[:-2, 1:-1] +
+            number_of_hares[2:, 1:-1] + 
+            number_of_hares[1:-1, :-2] 
+            + number_of_hares[1:-1, 2:]) - 
+            (neighbours * 
+            hares))))
+
+    new_pumas = (pumas + 
+            time_step_size * 
+            ((rates['birth_rate_pumas'] * 
+            hares * pumas) - 
+            (rates['death_rate_pumas'] * 
+            pumas) + 
+            rates['diffusion_rate_pumas'] * 
+            ((number_of_pumas[:-2, 1:-1] 
+            + number_of_pumas[2:, 1:-1] + 
+            number_of_pumas[1:-1, :-2] 
+            + number_of_pumas[1:-1, 2:]) - 
+            (neighbours * 
+            pumas))))
+
+    # Set negative numbers of hares and pumas to zero and update only the 
+    # land squares, leaving water squares as they are.
+    new_hares[new_hares < 0] = 0
+    new_pumas[new_pumas < 0] = 0
+    np.copyto(number_of_new_hares[1:-1, 1:-1], new_hares, where=land)
+    np.copyto(number_of_new_pumas[1:-1, 1:-1], new_pumas, where=land)
 
     return number_of_new_hares, number_of_new_pumas
\ No newline at end of file
@@ -0,0 +1,509 @@
+from argparse import ArgumentParser
+from collections import OrderedDict, deque
+from contextlib import redirect_stdout
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import heapq
+import itertools
+import json
+import multiprocessing
+import os
+import threading
+import time
+import simulate_predator_prey as spp
+import simulation_functions as sf
+import simulation_arguments as sa
+import memory_accounting as ma
+import species
+
+
+# The number of prepared landscapes each worker keeps in memory.
+LANDSCAPE_CACHE_SIZE = 8
+
+# Job states which the job can no longer leave.
+FINISHED_STATES = ("finished", "cancelled", "failed")
+
+# The number of seconds between checks that the worker processes are alive.
+WORKER_CHECK_INTERVAL = 1.0
+
+def get_server_command_line_arguments():
+    """
+    Get command line arguments required to run the simulation server.
+
+    :return: parameters
+    :rtype: ArgumentParser
+    """
+    parameters = ArgumentParser()
+    parameters.add_argument("--host", type=str, default="127.0.0.1",
+                        help="Address to listen on")
+    parameters.add_argument("--port", type=int, default=8000,
+                        help="Port to listen on")
+    parameters.add_argument("-w", "--workers", type=int,
+                        default=os.cpu_count() or 1,
+                        help="Number of simulations to run at once")
+    parameters.add_argument("-o", "--output-directory", type=str,
+                        default="jobs",
+                        help="Directory holding the output of each job")
+    parameters.add_argument("-k", "--keep-finished", type=int, default=1000,
+                        help="Number of finished jobs to remember, after "
+                            "which the oldest are forgotten")
+
+    return parameters
+
+def get_prepared_landscape(landscape_cache, simulation_args):
+    """
+    Returns the prepared landscape for the landscape file of a simulation,
+    preparing it and adding it to the cache if the file has not been seen
+    before or has changed since it was prepared.
+
+    :param landscape_cache: landscape_cache
+    :type landscape_cache: OrderedDict
+    :param simulation_args: simulation_args
+    :type simulation_args: dict
+    :return: the result of sf.prepare_landscape for the landscape file
+    :rtype: tuple
+    """
+    landscape_file = simulation_args['landscape_file']
+    key = (landscape_file, os.stat(landscape_file).st_mtime_ns)
+
+    if key in landscape_cache:
+        # Mark the landscape as the most recently used.
+        landscape_cache.move_to_end(key)
+    else:
+        landscape_cache[key] = sf.prepare_landscape(simulation_args)
+        # Forget the least recently used landscape if the cache is full.
+        if len(landscape_cache) > LANDSCAPE_CACHE_SIZE:
+            landscape_cache.popitem(last=False)
+
+    return landscape_cache[key]
+
+def run_worker(worker_index, job_queue, event_queue, cancel_event):
+    """
+    Runs simulations handed to the worker, one at a time, until it is given
+    None. Progress and the outcome of each simulation are put on the event
+    queue as (worker_index, job_id, event) tuples.
+
+    :param worker_index: worker_index
+    :type worker_index: int
+    :param job_queue: queue of (job_id, simulation_args, output_directory)
+    :type job_queue: multiprocessing.Queue
+    :param event_queue: event_queue
+    :type event_queue: multiprocessing.Queue
+    :param cancel_event: set when the current simulation should be abandoned
+    :type cancel_event: multiprocessing.Event
+    """
+    # Prepared landscapes are kept for the lifetime of the worker so that
+    # jobs on the same landscape file do not have to read it in again.
+    landscape_cache = OrderedDict()
+
+    for job_id, simulation_args, output_directory in iter(job_queue.get,
+                                                        None):
+        def progress(i, simulation_args, average_number_of_hares,
+                    average_number_of_pumas):
+            event_queue.put((worker_index, job_id, {
+                'event' : "averages",
+                'timestep' : i,
+                'time' : i*simulation_args['time_step_size'],
+                'hares' : float(average_number_of_hares),
+                'pumas' : float(average_number_of_pumas),
+            }))
+
+        event_queue.put((worker_index, job_id, {'event' : "running"}))
+        try:
+            os.makedirs(output_directory, exist_ok=True)
+            os.chdir(output_directory)
+            # Keep the output which would otherwise be printed to the
+            # terminal with the rest of the output of the job.
+            with open("output.txt", "w") as file_object, \
+                    redirect_stdout(file_object):
+                # Only the in-memory engine uses a prepared landscape. The
+                # out-of-core and distributed engines read the landscape in
+                # themselves, and caching it here would hold all of it in
+                # memory.
+                if simulation_args['engine'] == "memory":
+                    prepared_landscape = get_prepared_landscape(
+                        landscape_cache, simulation_args)
+                else:
+                    prepared_landscape = None
+                completed = spp.run_simulation(simulation_args,
+                                            prepared_landscape, progress,
+                                            cancel_event.is_set)
+        except Exception as error:
+            event_queue.put((worker_index, job_id,
+                            {'event' : "failed", 'error' : repr(error)}))
+        else:
+            event_queue.put((worker_index, job_id,
+                {'event' : "finished" if completed else "cancelled"}))
+
+class SimulationServer:
+    """
+    Keeps a bounded pool of long-lived worker processes and hands them
+    simulation jobs in order of priority, highest first, and then in the
+    order they were submitted.
+    """
+
+    def __init__(self, number_of_workers, output_directory,
+                keep_finished=1000):
+        self.output_directory = os.path.abspath(output_directory)
+        self.jobs = {}
+        self.pending = []
+        self.finished_jobs = deque()
+        self.keep_finished = keep_finished
+        self.idle_workers = list(range(number_of_workers))
+        self.job_ids = itertools.count(1)
+        self.condition = threading.Condition()
+        self.stopping = False
+        # Worker processes are spawned rather than forked, as a worker which
+        # has died is replaced while the threads of the server are running,
+        # and a forked worker could inherit a lock held by one of them.
+        self.context = multiprocessing.get_context("spawn")
+        self.event_queue = self.context.Queue()
+        self.job_queues = [None] * number_of_workers
+        self.cancel_events = [None] * number_of_workers
+        self.workers = [None] * number_of_workers
+
+    def start_worker(self, worker_index):
+        """
+        Starts a worker process, with its own job queue and cancel event.
+
+        :param worker_index: worker_index
+        :type worker_index: int
+        """
+        self.job_queues[worker_index] = self.context.Queue()
+        self.cancel_events[worker_index] = self.context.Event()
+        self.workers[worker_index] = self.context.Process(target=run_worker,
+            args=(worker_index, self.job_queues[worker_index],
+                self.event_queue, self.cancel_events[worker_index]),
+            daemon=True)
+        self.workers[worker_index].start()
+
+    def start(self):
+        """
+        Starts the worker processes and the threads which hand jobs to them,
+        collect their events and replace those which have died.
+        """
+        for worker_index in range(len(self.workers)):
+            self.start_worker(worker_index)
+        threading.Thread(target=self.dispatch_jobs, daemon=True).start()
+        threading.Thread(target=self.collect_events, daemon=True).start()
+        threading.Thread(target=self.watch_workers, daemon=True).start()
+
+    def stop(self):
+        """
+        Abandons any running simulations and stops the worker processes.
+        """
+        with self.condition:
+            self.stopping = True
+        for index, job_queue in enumerate(self.job_queues):
+            self.cancel_events[index].set()
+            job_queue.put(None)
+        for worker in self.workers:
+            worker.join()
+
+    def submit(self, argv, priority=0):
+        """
+        Adds a simulation job to the queue.
+
+        :param argv: the command-line arguments of the simulation
+        :type argv: list of type str
+        :param priority: jobs with a higher priority are run first
+        :type priority: int
+        :return: the job
+        :rtype: dict
+        """
+        # Parse the arguments straight away so that invalid jobs are
+        # rejected rather than queued.
+        simulation_args = sf.create_args_dictionary(
+            sf.get_command_line_arguments(), argv)
+        simulation_args['landscape_file'] = \
+            os.path.abspath(simulation_args['landscape_file'])
+        # Rates given as raster files are also found relative to the
+        # directory the server was started in.
+        for name in sf.RATE_NAMES:
+            if isinstance(simulation_args[name], str):
+                simulation_args[name] = os.path.abspath(simulation_args[name])
+        if simulation_args['species_file'] is not None:
+            simulation_args['species_file'] = \
+                os.path.abspath(simulation_args['species_file'])
+        if not os.path.isfile(simulation_args['landscape_file']):
+            raise ValueError("No such landscape file: {}".format(
+                simulation_args['landscape_file']))
+        sa.check_engine_options(simulation_args)
+        sa.check_regions(simulation_args['regions'],
+            *ma.read_landscape_dimensions(simulation_args['landscape_file']))
+        if simulation_args['species_file'] is not None:
+            species.read_species_file(simulation_args['species_file'])
+
+        with self.condition:
+            job_id = next(self.job_ids)
+            job = {
+                'id' : job_id,
+                'priority' : priority,
+                'state' : "queued",
+                'simulation_args' : simulation_args,
+                'output_directory' : os.path.join(self.output_directory,
+                                        "job_{:04d}".format(job_id)),
+                'events' : [],
+                'worker' : None,
+            }
+            self.jobs[job_id] = job
+            heapq.heappush(self.pending, (-priority, job_id))
+            self.condition.notify_all()
+
+        return job
+
+    def cancel(self, job_id):
+        """
+        Cancels a job, removing it from the queue if it has not started yet
+        or abandoning the simulation if it is running.
+
+        :param job_id: job_id
+        :type job_id: int
+        :return: the job
+        :rtype: dict
+        """
+        with self.condition:
+            job = self.jobs[job_id]
+            if job['state'] == "queued":
+                # The entry is left in the queue and skipped when reached.
+                self.set_state(job, "cancelled")
+            elif job['state'] in ("starting", "running"):
+                self.cancel_events[job['worker']].set()
+
+        return job
+
+    def set_state(self, job, state, event=None):
+        """
+        Records a change in the state of a job as one of its events. Must be
+        called with the condition held.
+
+        :param job: job
+        :type job: dict
+        :param state: state
+        :type state: str
+        :param event: the event reporting the change
+        :type event: dict
+        """
+        job['state'] = state
+        job['events'].append(event or {'event' : state})
+        self.condition.notify_all()
+
+        # Forget the oldest finished jobs, and their events, once more than
+        # keep_finished have finished.
+        if state in FINISHED_STATES:
+            self.finished_jobs.append(job['id'])
+            while len(self.finished_jobs) > self.keep_finished:
+                del self.jobs[self.finished_jobs.popleft()]
+
+    def dispatch_jobs(self):
+        """
+        Hands the highest priority queued job to an idle worker whenever
+        there are both.
+        """
+        while True:
+            with self.condition:
+                self.condition.wait_for(
+                    lambda: self.pending and self.idle_workers)
+                _, job_id = heapq.heappop(self.pending)
+                job = self.jobs.get(job_id)
+                if job is None or job['state'] != "queued":
+                    continue
+                worker_index = self.idle_workers.pop()
+                job['worker'] = worker_index
+                job['state'] = "starting"
+                self.cancel_events[worker_index].clear()
+                self.job_queues[worker_index].put((job_id,
+                    job['simulation_args'], job['output_directory']))
+
+    def collect_events(self):
+        """
+        Records the events reported by the workers against their jobs.
+        """
+        while True:
+            worker_index, job_id, event = self.event_queue.get()
+            with self.condition:
+                # Skip the events of jobs which have already been marked as
+                # failed because their worker died, or been forgotten.
+                job = self.jobs.get(job_id)
+                if job is None or job['state'] in FINISHED_STATES:
+                    continue
+                if event['event'] == "averages":
+                    job['events'].append(event)
+                    self.condition.notify_all()
+                else:
+                    self.set_state(job, event['event'], event)
+                if event['event'] in FINISHED_STATES:
+                    self.idle_workers.append(worker_index)
+
+    def watch_workers(self):
+        """
+        Marks the job of any worker process which has died, for example
+        because it ran out of memory, as failed, and starts a new worker in
+        its place.
+        """
+        while True:
+            time.sleep(WORKER_CHECK_INTERVAL)
+            with self.condition:
+                if self.stopping:
+                    return
+                for worker_index, worker in enumerate(self.workers):
+                    if worker.is_alive():
+                        continue
+                    for job in list(self.jobs.values()):
+                        if job['worker'] == worker_index \
+                                and job['state'] in ("starting", "running"):
+                            self.set_state(job, "failed", {
+                                'event' : "failed",
+                                'error' : "Worker exited with code {}"
+                                    .format(worker.exitcode)})
+                    self.start_worker(worker_index)
+                    if worker_index not in self.idle_workers:
+                        self.idle_workers.append(worker_index)
+                    self.condition.notify_all()
+
+    def describe(self, job):
+        """
+        Returns the parts of a job which are reported to clients.
+
+        :param job: job
+        :type job: dict
+        :return: summary of the job
+        :rtype: dict
+        """
+        return {
+            'id' : job['id'],
+            'priority' : job['priority'],
+            'state' : job['state'],
+            'output_directory' : job['output_directory'],
+            'simulation_args' : job['simulation_args'],
+        }
+
+    def stream_events(self, job_id):
+        """
+        Yields the events of a job as they happen, starting with those which
+        have already happened, until the job is over.
+
+        :param job_id: job_id
+        :type job_id: int
+        :return: generator of events
+        :rtype: generator
+        """
+        job = self.jobs[job_id]
+        number_sent = 0
+        while True:
+            with self.condition:
+                self.condition.wait_for(
+                    lambda: len(job['events']) > number_sent
+                        or job['state'] in FINISHED_STATES)
+                events = job['events'][number_sent:]
+                over = job['state'] in FINISHED_STATES
+            number_sent += len(events)
+            yield from events
+            if over and not events:
+                return
+
+class SimulationRequestHandler(BaseHTTPRequestHandler):
+    """
+    Serves the JSON interface of the simulation server:
+
+    * POST /jobs with {"args": [...], "priority": 0} submits a job, where
+      "args" are the command-line arguments of simulate_predator_prey.py.
+    * GET /jobs and GET /jobs/<id> describe the jobs.
+    * GET /jobs/<id>/events streams the events of a job, one JSON object
+      per line, until the job is over.
+    * DELETE /jobs/<id> cancels a job.
+    """
+
+    def send_json(self, status, body):
+        data = (json.dumps(body) + "\n").encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def find_job_id(self):
+        parts = self.path.strip("/").split("/")
+        if len(parts) < 2 or parts[0] != "jobs" or not parts[1].isdigit() \
+                or int(parts[1]) not in self.server.simulation_server.jobs:
+            return None, parts
+        return int(parts[1]), parts
+
+    def do_GET(self):
+        simulation_server = self.server.simulation_server
+        if self.path.strip("/") == "jobs":
+            with simulation_server.condition:
+                jobs = [simulation_server.describe(job)
+                        for job in simulation_server.jobs.values()]
+            self.send_json(200, jobs)
+            return
+
+        job_id, parts = self.find_job_id()
+        if job_id is None:
+            self.send_json(404, {'error' : "Not found"})
+        elif len(parts) == 2:
+            with simulation_server.condition:
+                self.send_json(200, simulation_server.describe(
+                    simulation_server.jobs[job_id]))
+        elif len(parts) == 3 and parts[2] == "events":
+            self.send_response(200)
+            self.send_header("Content-Type", "application/x-ndjson")
+            self.end_headers()
+            self.close_connection = True
+            for event in simulation_server.stream_events(job_id):
+                self.wfile.write((json.dumps(event) + "\n").encode())
+                self.wfile.flush()
+        else:
+            self.send_json(404, {'error' : "Not found"})
+
+    def do_POST(self):
+        if self.path.strip("/") != "jobs":
+            self.send_json(404, {'error' : "Not found"})
+            return
+        try:
+            length = int(self.headers.get("Content-Length", 0))
+            body = json.loads(self.rfile.read(length) or b"{}")
+            job = self.server.simulation_server.submit(
+                [str(arg) for arg in body.get("args", [])],
+                int(body.get("priority", 0)))
+        except SystemExit:
+            # ArgumentParser exits when it is given invalid arguments.
+            self.send_json(400, {'error' : "Invalid simulation arguments"})
+        except (ValueError, AttributeError) as error:
+            self.send_json(400, {'error' : str(error)})
+        else:
+            with self.server.simulation_server.condition:
+                self.send_json(201, self.server.simulation_server.describe(job))
+
+    def do_DELETE(self):
+        job_id, parts = self.find_job_id()
+        if job_id is None or len(parts) != 2:
+            self.send_json(404, {'error' : "Not found"})
+            return
+        job = self.server.simulation_server.cancel(job_id)
+        with self.server.simulation_server.condition:
+            self.send_json(200, self.server.simulation_server.describe(job))
+
+def serve():
+    # Get command line arguments from the terminal.
+    args = get_server_command_line_arguments().parse_args()
+
+    simulation_server = SimulationServer(args.workers, args.output_directory,
+                                        args.keep_finished)
+    simulation_server.start()
+
+    http_server = ThreadingHTTPServer((args.host, args.port),
+                                    SimulationRequestHandler)
+    http_server.daemon_threads = True
+    http_server.simulation_server = simulation_server
+    print("Serving simulations on http://{}:{}/jobs with {} workers"
+        .format(args.host, args.port, args.workers))
+    try:
+        http_server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        http_server.server_close()
+        simulation_server.stop()
+
+if __name__ == "__main__":
+    serve()
@@ -0,0 +1,357 @@
+import json
+import os
+import numpy as np
+import simulation_functions as sf
+import averages_output as ao
+import reductions
+
+
+# The names of the species of the predator-prey simulation, which are used
+# unless a species file is given.
+DEFAULT_SPECIES_NAMES = ("Hares", "Pumas")
+
+# The keys each species in a species file must have.
+SPECIES_KEYS = ('name', 'seed', 'growth_rate', 'diffusion_rate')
+
+# The characters a species name may not contain, as the names are used as
+# the header of averages.csv and as file names in the binary averages.
+FORBIDDEN_NAME_CHARACTERS = (",", "/", "\\")
+
+def read_species_file(file_name):
+    """
+    Reads the description of the species from a species file, checking that
+    it can be simulated, so that mistakes in it are reported before the
+    simulation starts.
+
+    :param file_name: file_name
+    :type file_name: str
+    :return: description of the species and their interactions
+    :rtype: dict
+    """
+    with open(file_name, "r") as file_object:
+        description = json.load(file_object)
+    if not isinstance(description, dict) or 'species' not in description \
+            or 'interactions' not in description:
+        raise ValueError("The species file {} must give 'species' and "
+                        "'interactions'".format(file_name))
+
+    species = description['species']
+    # The map files, animations and shared memory show the first two
+    # species, so there must be at least two.
+    if len(species) < 2:
+        raise ValueError("A species file must describe at least two "
+                        "species, not {}".format(len(species)))
+
+    # The names are the columns of the averages, which are told apart
+    # ignoring case, as the binary averages store each column in a file
+    # named after it.
+    reserved_names = {name.lower() : name
+                    for name, _ in ao.AVERAGES_COLUMNS[:2]}
+    names = []
+    for number, entry in enumerate(species, 1):
+        missing_keys = [key for key in SPECIES_KEYS if key not in entry]
+        if missing_keys:
+            raise ValueError("Species {} in the species file has no {}"
+                            .format(number, ", ".join(missing_keys)))
+        name = entry['name']
+        if not isinstance(name, str) or not name:
+            raise ValueError("The name of species {} in the species file "
+                            "must be a non-empty string".format(number))
+        if any(character in name
+                for character in FORBIDDEN_NAME_CHARACTERS):
+            raise ValueError("The species name {!r} may not contain any of "
+                            "{}".format(name, " ".join(
+                                FORBIDDEN_NAME_CHARACTERS)))
+        if name.lower() in reserved_names:
+            raise ValueError("The species name {!r} is taken by the {} "
+                            "column of the averages".format(name,
+                                            reserved_names[name.lower()]))
+        if name.lower() in names:
+            raise ValueError("More than one species is named {!r}, "
+                            "ignoring case".format(name))
+        names.append(name.lower())
+
+    interactions = description['interactions']
+    if len(interactions) != len(species) \
+            or any(len(row) != len(species) for row in interactions):
+        raise ValueError("The interaction matrix of {} species must be {} "
+                        "by {}".format(len(species), len(species),
+                                    len(species)))
+
+    return description
+
+def load_rate(rate, directory, grid_dimensions):
+    """
+    Gets a rate given in a species file, which is either a number or the
+    name of a .npy raster file, relative to the directory of the species
+    file, holding a rate for each square of the landscape.
+
+    :param rate: rate
+    :type rate: float or str
+    :param directory: directory
+    :type directory: str
+    :param grid_dimensions: grid_dimensions
+    :type grid_dimensions: list of type int
+    :return: rate, or grid with the dimensions of the landscape without the
+    halo
+    :rtype: float or ndarray
+    """
+    if not isinstance(rate, str):
+        return float(rate)
+
+    return sf.load_raster(os.path.join(directory, rate), grid_dimensions)
+
+def stack_rates(rates, signs=None):
+    """
+    Stacks a list of rates, each a number or a grid, into one array of shape
+    (number of rates, 1, 1) if they are all numbers. Otherwise the rates are
+    left as a list, so that grids, which may be memory-mapped raster files,
+    are not copied and numbers are not turned into grids.
+
+    The sign of each rate, if given, is applied to the numbers straight away.
+    Grids are left as they are, as negating them would copy them, so their
+    signs are returned to be applied when the rates are used.
+
+    :param rates: rates
+    :type rates: list
+    :param signs: 1 or -1 for each rate
+    :type signs: list of type int
+    :return: the stacked rates, and the signs still to be applied
+    :rtype: tuple
+    """
+    if signs is None:
+        signs = [1] * len(rates)
+    remaining_signs = [1 if np.isscalar(rate) else sign
+                    for rate, sign in zip(rates, signs)]
+    rates = [sign * rate if np.isscalar(rate) else rate
+            for rate, sign in zip(rates, signs)]
+
+    if all(np.isscalar(rate) for rate in rates):
+        return np.array(rates, float).reshape(-1, 1, 1), remaining_signs
+    return rates, remaining_signs
+
+def multiply_rates(rates, grids, out=None):
+    """
+    Multiplies the grid of each species by its rate, with the rates stacked
+    by stack_rates.
+
+    :param rates: the stacked rates
+    :type rates: ndarray or list
+    :param grids: grids
+    :type grids: ndarray
+    :param out: array to put the products in, which may be grids
+    :type out: ndarray
+    :return: products
+    :rtype: ndarray
+    """
+    if isinstance(rates, np.ndarray):
+        return np.multiply(rates, grids, out=out)
+
+    if out is None:
+        out = np.empty_like(grids)
+    for s, rate in enumerate(rates):
+        np.multiply(rate, grids[s], out=out[s])
+    return out
+
+def create_species_model(simulation_args, grid_dimensions):
+    """
+    Creates the model of the species in the simulation: the names and seeds
+    of the species and, for each species s, the rates in
+
+        dN_s/dt = g_s N_s + sum over j of A_sj N_s N_j + D_s (diffusion of N_s)
+
+    where g is the growth rate, A the interaction matrix and D the diffusion
+    rate of each species. Unless a species file is given, the model is that
+    of hares and pumas, with
+
+        g = (r, -m), A = ((0, -a), (b, 0)), D = (k, l)
+
+    :param simulation_args: simulation_args
+    :type simulation_args: dict
+    :param grid_dimensions: grid_dimensions
+    :type grid_dimensions: list of type int
+    :return: dictionary of names, seeds, growth_rates, growth_signs,
+    interactions, interaction_signs, diffusion_rates and interacting_pairs
+    :rtype: dict
+    """
+    if simulation_args['species_file'] is None:
+        rates = sf.load_rates(simulation_args, grid_dimensions)
+        names = list(DEFAULT_SPECIES_NAMES)
+        seeds = [simulation_args['hseed'], simulation_args['pseed']]
+        # The rates are given as positive numbers or raster files, and
+        # negated by their signs.
+        growth_rates = [rates['birth_rate_hares'], rates['death_rate_pumas']]
+        growth_signs = [1, -1]
+        interactions = [[0.0, rates['death_rate_hares']],
+                        [rates['birth_rate_pumas'], 0.0]]
+        interaction_signs = [1, -1, 1, 1]
+        diffusion_rates = [rates['diffusion_rate_hares'],
+                        rates['diffusion_rate_pumas']]
+    else:
+        description = read_species_file(simulation_args['species_file'])
+        directory = os.path.dirname(simulation_args['species_file'])
+        species = description['species']
+        names = [entry['name'] for entry in species]
+        seeds = [entry['seed'] for entry in species]
+        growth_rates = [load_rate(entry['growth_rate'], directory,
+                                grid_dimensions) for entry in species]
+        diffusion_rates = [load_rate(entry['diffusion_rate'], directory,
+                                    grid_dimensions) for entry in species]
+        interactions = [[load_rate(rate, directory, grid_dimensions)
+                        for rate in row]
+                        for row in description['interactions']]
+        growth_signs = None
+        interaction_signs = None
+
+    # Only the pairs of species which interact are calculated, so a food
+    # chain costs two products per species rather than one per pair of
+    # species.
+    interacting_pairs = [(s, j) for s, row in enumerate(interactions)
+                        for j, rate in enumerate(row) if np.any(rate)]
+
+    growth_rates, growth_signs = stack_rates(growth_rates, growth_signs)
+    interactions, interaction_signs = stack_rates(
+        [rate for row in interactions for rate in row], interaction_signs)
+
+    return {
+        'names' : names,
+        'seeds' : seeds,
+        'growth_rates' : growth_rates,
+        'growth_signs' : growth_signs,
+        'interactions' : interactions,
+        'interaction_signs' : interaction_signs,
+        'diffusion_rates' : stack_rates(diffusion_rates)[0],
+        'interacting_pairs' : interacting_pairs,
+    }
+
+def create_populations(grid_dimensions, landscape, species_model):
+    """
+    Creates one grid holding the population densities of every species,
+    assigning a random density between 0 and 5.0 to each land square from
+    the seed of each species.
+
+    :param grid_dimensions: grid_dimensions
+    :type grid_dimensions: list of type int
+    :param landscape: landscape
+    :type landscape: ndarray
+    :param species_model: the result of create_species_model
+    :type species_model: dict
+    :return: grid of shape (number of species, height including halo, width
+    including halo)
+    :rtype: ndarray
+    """
+    return np.stack([sf.calculate_population(grid_dimensions, landscape, seed)
+                    for seed in species_model['seeds']])
+
+def calculate_averages(populations, number_land_only_squares,
+                    reproducible=False):
+    """
+    Calculates the average density of each species in the landscape.
+
+    :param populations: populations
+    :type populations: ndarray
+    :param number_land_only_squares: number_land_only_squares
+    :type number_land_only_squares: int
+    :param reproducible: sum the densities in the same order as every other
+    engine, however the landscape is split up
+    :type reproducible: bool
+    :return: average density of each species
+    :rtype: list
+    """
+    if number_land_only_squares != 0:
+        if reproducible:
+            return [reductions.calculate_reproducible_sum(
+                        population[1:-1, 1:-1]) / number_land_only_squares
+                    for population in populations]
+        return [np.sum(population) / number_land_only_squares
+                for population in populations]
+    return [0] * len(populations)
+
+def display_averages(i, time, species_model, averages):
+    """
+    Displays the average density of each species at the present timestep.
+
+    :param i: i
+    :type i: int
+    :param time: time in seconds
+    :type time: float
+    :param species_model: species_model
+    :type species_model: dict
+    :param averages: averages
+    :type averages: list
+    """
+    print("Averages. Timestep: {} Time (s): {} ".format(i, time)
+        + " ".join("{}: {}".format(name, average) for name, average in
+                zip(species_model['names'], averages)))
+
+def calculate_the_number_of_new_populations(landscape, new_populations,
+            populations, simulation_args, species_model, land_neighbours):
+    """
+    Calculates the population densities of every species at the next time
+    step, for all of the squares of the landscape and all of the species at
+    once.
+
+    For hares and pumas the terms are grouped, and the products formed, in
+    the same order as in the original simulation, so that the results are
+    identical.
+
+    :param landscape: landscape
+    :type landscape: ndarray
+    :param new_populations: new_populations
+    :type new_populations: ndarray
+    :param populations: populations
+    :type populations: ndarray
+    :param simulation_args: simulation_args
+    :type simulation_args: dict
+    :param species_model: the result of create_species_model
+    :type species_model: dict
+    :param land_neighbours: land_neighbours
+    :type land_neighbours: ndarray
+    :return: the new population densities
+    :rtype: ndarray
+    """
+    # Select the squares of each grid which are not "halo" squares.
+    current = populations[:, 1:-1, 1:-1]
+    neighbours = land_neighbours[1:-1, 1:-1]
+    land = landscape[1:-1, 1:-1] != 0
+    number_of_species = len(populations)
+
+    # Rates which are rasters are negated here, by negating their products
+    # or subtracting rather than adding them, which rounds in the same way
+    # as multiplying by the negated rate.
+    change = multiply_rates(species_model['growth_rates'], current)
+    for s, sign in enumerate(species_model['growth_signs']):
+        if sign < 0:
+            np.negative(change[s], out=change[s])
+    for s, j in species_model['interacting_pairs']:
+        # The product is formed with the species which comes first, which
+        # for pumas eating hares gives the same rounding as b*H*P and a*H*P.
+        first, second = min(s, j), max(s, j)
+        k = s * number_of_species + j
+        add = np.subtract if species_model['interaction_signs'][k] < 0 \
+            else np.add
+        add(change[s], (species_model['interactions'][k] * current[first])
+            * current[second], out=change[s])
+
+    diffusion = ((populations[:, :-2, 1:-1] +
+                populations[:, 2:, 1:-1] +
+                populations[:, 1:-1, :-2]
+                + populations[:, 1:-1, 2:]) -
+                (neighbours *
+                current))
+    multiply_rates(species_model['diffusion_rates'], diffusion,
+                out=diffusion)
+
+    # Add up the terms in place, in the same order as
+    # current + dt*(change + diffusion).
+    change += diffusion
+    del diffusion
+    change *= simulation_args['time_step_size']
+    new = np.add(current, change, out=change)
+
+    # Set negative densities to zero and update only the land squares,
+    # leaving water squares as they are.
+    new[new < 0] = 0
+    np.copyto(new_populations[:, 1:-1, 1:-1], new, where=land)
+
+    return new_populations